@@ -0,0 +1,78 @@
+"""
+Stand-in for an OpenAI-compatible LLM server that can be made slow or flaky,
+to exercise the provider pool's hedging and failover without real providers.
+
+    python benchmarks/fake_llm_server.py --port 8001 --delay 0.5 --jitter 2 --error-rate 0.2
+
+Point the bot at it with LOCAL_LLM_URL=http://localhost:8001 and a provider
+such as LLM_PROVIDERS=local/openai/fake,openai/gpt-4o-mini. Every local/
+provider uses the same LOCAL_LLM_URL, so pair it with a hosted provider to
+see hedges and failovers.
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+from aiohttp import web
+
+def completion_text(body: dict) -> str:
+    last_message = body["messages"][-1]["content"] if body.get("messages") else ""
+    return f"Stand-in answer to: {last_message[:200]}"
+
+async def chat_completions(request: web.Request) -> web.StreamResponse:
+    options = request.app["options"]
+    body = await request.json()
+    # Occasional long delays model the latency tail that hedging is meant to cut
+    delay = options.delay
+    if random.random() < options.slow_rate:
+        delay += options.jitter
+    await asyncio.sleep(delay)
+    if random.random() < options.error_rate:
+        return web.json_response({"error": {"message": "Stand-in failure", "type": "server_error"}}, status=500)
+
+    text = completion_text(body)
+    created = int(time.time())
+    if not body.get("stream"):
+        return web.json_response({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": created,
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(text.split()), "total_tokens": len(text.split())},
+        })
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    for word in text.split(" "):
+        chunk = {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}],
+        }
+        await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        await asyncio.sleep(options.token_delay)
+    await response.write(b"data: [DONE]\n\n")
+    return response
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--delay", type=float, default=0.2, help="Seconds before every response")
+    parser.add_argument("--jitter", type=float, default=2.0, help="Extra seconds added to slow responses")
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="Share of responses that get the extra delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with HTTP 500")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds between streamed words")
+    options = parser.parse_args()
+
+    app = web.Application()
+    app["options"] = options
+    app.router.add_post("/chat/completions", chat_completions)
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    web.run_app(app, port=options.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Measures how long the bot takes to start: the time to import bot.py and build
+the bot, which modules that pulls in, and optionally how long the background
+grounding warmup takes until the index is ready.
+
+    python benchmarks/startup_benchmark.py --runs 5
+    python benchmarks/startup_benchmark.py --warmup
+
+Every import run starts a fresh interpreter, so nothing is served from modules
+already loaded. Settings come from .env like the bot itself.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Dependencies that should only be imported once a feature needs them
+HEAVY_MODULES = ["langchain", "langchain_openai", "langchain_community", "chromadb", "litellm",
+                 "openai", "boto3", "azure.storage.blob", "sentence_transformers"]
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import bot
+imported = time.perf_counter()
+bot.setup_bot()
+built = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported - start,
+    "setup_seconds": built - imported,
+    "modules": len(sys.modules),
+    "heavy": [name for name in %r if name in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+def measure_import() -> dict:
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_seconds"] = time.perf_counter() - start
+    return result
+
+async def measure_warmup() -> float:
+    sys.path.insert(0, ROOT)
+    from utils.grounding_utils import grounding_loader
+    start = time.perf_counter()
+    grounding_loader.start_warmup()
+    await grounding_loader.warmup_task
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to time the import in")
+    parser.add_argument("--warmup", action="store_true", help="Also time the grounding warmup")
+    options = parser.parse_args()
+
+    results = [measure_import() for _ in range(options.runs)]
+    for key in ("import_seconds", "setup_seconds", "process_seconds"):
+        values = [result[key] for result in results]
+        print(f"{key}: median {statistics.median(values):.3f}s, min {min(values):.3f}s, max {max(values):.3f}s")
+    print(f"modules loaded: {results[-1]['modules']}")
+    print(f"heavy modules loaded at startup: {', '.join(results[-1]['heavy']) or 'none'}")
+
+    if options.warmup:
+        print(f"grounding warmup: {asyncio.run(measure_warmup()):.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,16 @@ import sys
 from config import Config
 from commands import setup_commands
 from utils.llm_utils import generate_response
-from utils.grounding_utils import load_grounding_data
+from utils.context import summarizer
+from utils.conversation import ConversationStore
+from utils.rate_limiter import RateLimiter
+from utils.scheduler import LLMScheduler
+from utils.send_queue import SendQueue
+from utils.providers import ProviderPool
+from utils.question_bank import question_bank
+from utils.trivia_game import active_games
+from utils.tts_utils import VoicePlayers
+from utils.grounding_utils import grounding_loader
 
 # Set up logging
 logging.basicConfig(
@@ -30,14 +39,42 @@ def setup_bot():
     )
     
     bot.config = Config
-    bot.conversation_history = {}
-    bot.request_timestamps = []
+    bot.conversations = ConversationStore(
+        max_messages=Config.MAX_MESSAGES,
+        max_channels=Config.CONVERSATION_MAX_CHANNELS,
+        ttl=Config.CONVERSATION_TTL,
+        db_path=Config.CONVERSATION_DB_PATH or None,
+        flush_interval=Config.CONVERSATION_FLUSH_INTERVAL,
+        on_evict=summarizer.clear,
+    )
+    bot.rate_limiter = RateLimiter(
+        user_rpm=Config.USER_REQUESTS_PER_MINUTE,
+        guild_rpm=Config.GUILD_REQUESTS_PER_MINUTE,
+        global_rpm=Config.MAX_REQUESTS_PER_MINUTE,
+        window=Config.REQUEST_WINDOW,
+        provider_rpm=Config.PROVIDER_REQUESTS_PER_MINUTE,
+        provider_tpm=Config.PROVIDER_TOKENS_PER_MINUTE,
+    )
+    bot.scheduler = LLMScheduler(Config.LLM_MAX_CONCURRENCY)
+    bot.providers = ProviderPool(Config.LLM_PROVIDERS, bot.rate_limiter)
+    bot.send_queue = SendQueue(Config.MAX_TEXT, Config.CHANNEL_SEND_RATE, Config.CHANNEL_SEND_BURST)
     bot.tts_enabled = Config.TTS_ENABLED
+    bot.voice_players = VoicePlayers()
 
-    async def bot_generate_response(messages):
-        return await generate_response(bot, messages)
+    async def bot_generate_response(messages, **kwargs):
+        return await generate_response(bot, messages, **kwargs)
 
     bot.generate_response = bot_generate_response
+
+    close_bot = bot.close
+
+    async def close():
+        # Write conversation turns still waiting for the background flush
+        await bot.conversations.close()
+        await question_bank.close()
+        await close_bot()
+
+    bot.close = close
     
     async def is_allowed(ctx):
         return (not Config.ALLOWED_CHANNEL_IDS or ctx.channel.id in Config.ALLOWED_CHANNEL_IDS) and \
@@ -55,11 +92,9 @@ def setup_bot():
         logger.info(f"Connected to {len(bot.guilds)} guilds")
         
         if bot.config.USE_GROUNDING:
-            logger.info("Loading grounding data...")
-            grounding_data = load_grounding_data()
-            logger.info(f"Grounding data loaded: {len(grounding_data)} files")
-            for data in grounding_data:
-                logger.info(f"Loaded: {data['filename']} (Content length: {len(data['content'])} characters)")
+            # Indexing runs in the background, so the bot answers (ungrounded) while it warms up
+            logger.info("Warming up grounding data in the background...")
+            grounding_loader.start_warmup()
         else:
             logger.info("Grounding is disabled")
         
@@ -67,7 +102,14 @@ def setup_bot():
     
     @bot.event
     async def on_message(message):
-        if message.author.bot or not await bot.is_allowed(message):
+        if message.author.bot:
+            return
+
+        game = active_games.get(message.channel.id)
+        if game is not None and game.submit_answer(message):
+            return
+
+        if not await bot.is_allowed(message):
             return
         
         await bot.process_commands(message)
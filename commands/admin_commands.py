@@ -1,5 +1,6 @@
 from discord.ext import commands
-from utils.grounding_utils import load_grounding_data  # Changed from llm_utils to grounding_utils
+from utils.grounding_utils import grounding_loader
+from utils.metrics import metrics
 
 def setup_admin_commands(bot):
     @bot.command()
@@ -7,44 +8,52 @@ def setup_admin_commands(bot):
     async def setstatus(ctx, *, new_status: str):
         """Set a new status for the bot (Admin only)."""
         await bot.change_presence(activity=discord.Game(name=new_status))
-        await ctx.send(f"Status updated to: {new_status}")
+        await bot.send_queue.send(ctx.channel, f"Status updated to: {new_status}")
 
     @bot.command()
     @commands.has_permissions(administrator=True)
     async def toggle_tts(ctx):
         """Toggle Text-to-Speech on/off (Admin only)."""
         bot.tts_enabled = not bot.tts_enabled
-        await ctx.send(f"Text-to-Speech is now {'enabled' if bot.tts_enabled else 'disabled'}.")
+        await bot.send_queue.send(ctx.channel, f"Text-to-Speech is now {'enabled' if bot.tts_enabled else 'disabled'}.")
 
     @bot.command()
     @commands.has_permissions(administrator=True)
     async def llm_info(ctx):
         """Display current LLM information (Admin only)."""
-        info = f"LLM Type: {bot.config.LLM_TYPE}\n"
-        info += f"LLM Model: {bot.config.LLM_MODEL}\n"
-        if bot.config.LLM_TYPE == "local":
+        info = f"LLM Providers:\n{bot.providers.describe()}\n"
+        if any(provider.type == "local" for provider in bot.providers.providers):
             info += f"Local LLM URL: {bot.config.LOCAL_LLM_URL}\n"
         settings_str = "\n".join(f"{k}: {v}" for k, v in bot.config.LLM_SETTINGS.items())
         info += f"LLM Settings:\n{settings_str}"
-        await ctx.send(f"Current LLM configuration:\n```\n{info}\n```")
+        await bot.send_queue.send(ctx.channel, f"Current LLM configuration:\n```\n{info}\n```")
 
     @bot.command()
     @commands.has_permissions(administrator=True)
     async def clear_history(ctx):
         """Clear conversation history for the current channel (Admin only)."""
-        if ctx.channel.id in bot.conversation_history:
-            del bot.conversation_history[ctx.channel.id]
-            await ctx.send("Conversation history cleared for this channel.")
+        if await bot.conversations.clear(ctx.channel.id):
+            await bot.send_queue.send(ctx.channel, "Conversation history cleared for this channel.")
         else:
-            await ctx.send("No conversation history found for this channel.")
+            await bot.send_queue.send(ctx.channel, "No conversation history found for this channel.")
 
     @bot.command()
     @commands.has_permissions(administrator=True)
     async def reload_grounding(ctx):
         """Reload grounding data (Admin only)."""
         try:
-            grounding_data = load_grounding_data()
-            await ctx.send(f"Grounding data reloaded. {len(grounding_data)} files loaded.")
+            report = await grounding_loader.load()
+            await bot.send_queue.send(ctx.channel,
+                f"Grounding data reloaded in {report['elapsed']:.2f} seconds. "
+                f"{len(report['added'])} added, {len(report['changed'])} changed, "
+                f"{len(report['removed'])} removed ({report['total']} files loaded)."
+            )
         except Exception as e:
             print(f"Error reloading grounding data: {e}")
-            await ctx.send("An error occurred while reloading grounding data. Please check the logs.")
\ No newline at end of file
+            await bot.send_queue.send(ctx.channel, "An error occurred while reloading grounding data. Please check the logs.")
+
+    @bot.command(name="metrics")
+    @commands.has_permissions(administrator=True)
+    async def show_metrics(ctx):
+        """Display performance metrics (Admin only)."""
+        await bot.send_queue.send(ctx.channel, f"Bot metrics:\n```\n{metrics.format_summary()[:bot.config.MAX_TEXT - 30]}\n```")
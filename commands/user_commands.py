@@ -16,10 +16,11 @@ def setup_user_commands(bot):
             f"`{bot.config.BOT_PREFIX}clear_history` - Clear conversation history (Admin only)\n"
             f"`{bot.config.BOT_PREFIX}translate <text>` - Translate text to English\n"
             f"`{bot.config.BOT_PREFIX}reload_grounding` - Reload grounding data (Admin only)\n"
+            f"`{bot.config.BOT_PREFIX}metrics` - Show bot performance metrics (Admin only)\n"
             f"`{bot.config.BOT_PREFIX}trivia <topic>` - Start a trivia game on the specified topic\n"
             "Mention the bot or DM it to start a conversation"
         )
-        await ctx.send(help_text)
+        await bot.send_queue.send(ctx.channel, help_text)
 
     @bot.command()
     async def translate(ctx, *, text: str):
@@ -27,11 +28,11 @@ def setup_user_commands(bot):
         try:
             translation = await generate_response(bot, [
                 {"role": "user", "content": f"Translate the following text to English: {text}"}
-            ])
-            await ctx.send(f"Translation: {translation}")
+            ], use_grounding=False, user_id=ctx.author.id, guild_id=ctx.guild.id if ctx.guild else None)
+            await bot.send_queue.send(ctx.channel, f"Translation: {translation}")
         except Exception as e:
             print(f"Translation error: {e}")
-            await ctx.send("An error occurred during translation. Please try again later.")
+            await bot.send_queue.send(ctx.channel, "An error occurred during translation. Please try again later.")
 
 
 
@@ -39,7 +40,7 @@ def setup_user_commands(bot):
     async def trivia(ctx, *, topic: str):
         """Start a trivia game on a specific topic."""
         if ctx.channel.id in active_games:
-            await ctx.send("A game is already in progress in this channel!")
+            await bot.send_queue.send(ctx.channel, "A game is already in progress in this channel!")
             return
 
         try:
@@ -47,9 +48,9 @@ def setup_user_commands(bot):
             active_games[ctx.channel.id] = game
             await game.start_game()
         except ValueError as e:
-            await ctx.send(f"Error starting the game: {str(e)}")
+            await bot.send_queue.send(ctx.channel, f"Error starting the game: {str(e)}")
         except Exception as e:
-            await ctx.send(f"An unexpected error occurred: {str(e)}")
+            await bot.send_queue.send(ctx.channel, f"An unexpected error occurred: {str(e)}")
         finally:
             if ctx.channel.id in active_games:
                 del active_games[ctx.channel.id]
@@ -59,7 +60,7 @@ def setup_user_commands(bot):
     async def stop_trivia(ctx):
         """Stop the current trivia game (Admin only)."""
         if ctx.channel.id in active_games:
-            active_games[ctx.channel.id].is_active = False
-            await ctx.send("Trivia game has been stopped.")
+            active_games[ctx.channel.id].stop()
+            await bot.send_queue.send(ctx.channel, "Trivia game has been stopped.")
         else:
-            await ctx.send("There is no active trivia game in this channel.")
\ No newline at end of file
+            await bot.send_queue.send(ctx.channel, "There is no active trivia game in this channel.")
\ No newline at end of file
@@ -7,22 +7,23 @@ def setup_voice_commands(bot):
     async def join(ctx):
         """Join the user's voice channel."""
         if not ctx.author.voice:
-            await ctx.send("You need to be in a voice channel to use this command.")
+            await bot.send_queue.send(ctx.channel, "You need to be in a voice channel to use this command.")
             return
         
         channel = ctx.author.voice.channel
         try:
             await channel.connect()
-            await ctx.send(f"Joined {channel.name}")
+            await bot.send_queue.send(ctx.channel, f"Joined {channel.name}")
         except Exception as e:
             print(f"Error joining voice channel: {e}")
-            await ctx.send("I couldn't join the voice channel. Please check my permissions.")
+            await bot.send_queue.send(ctx.channel, "I couldn't join the voice channel. Please check my permissions.")
 
     @bot.command()
     async def leave(ctx):
         """Leave the current voice channel."""
         if ctx.voice_client:
+            bot.voice_players.stop(ctx.guild.id)
             await ctx.voice_client.disconnect()
-            await ctx.send("Left the voice channel.")
+            await bot.send_queue.send(ctx.channel, "Left the voice channel.")
         else:
-            await ctx.send("I'm not in a voice channel.")
\ No newline at end of file
+            await bot.send_queue.send(ctx.channel, "I'm not in a voice channel.")
\ No newline at end of file
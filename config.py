@@ -39,13 +39,29 @@ class Config:
     
     # Message Limits
     MAX_TEXT = int(get_env("MAX_TEXT"))
+    CONTEXT_TOKEN_BUDGET = int(get_env("CONTEXT_TOKEN_BUDGET", "3000"))
+    SUMMARIZE_HISTORY = get_env("SUMMARIZE_HISTORY", "true").lower() == "true"
+    RESPONSE_CACHE_SIZE = int(get_env("RESPONSE_CACHE_SIZE", "1000"))
+    RESPONSE_CACHE_TTL = float(get_env("RESPONSE_CACHE_TTL", "3600"))
+    RESPONSE_CACHE_SIMILARITY = float(get_env("RESPONSE_CACHE_SIMILARITY", "0"))
+    STREAM_RESPONSES = get_env("STREAM_RESPONSES", "false").lower() == "true"
+    STREAM_EDIT_INTERVAL = float(get_env("STREAM_EDIT_INTERVAL", "1.5"))
     MAX_IMAGES = int(get_env("MAX_IMAGES"))
     MAX_MESSAGES = int(get_env("MAX_MESSAGES"))
+    CONVERSATION_MAX_CHANNELS = int(get_env("CONVERSATION_MAX_CHANNELS", "1000"))
+    CONVERSATION_TTL = float(get_env("CONVERSATION_TTL", "86400"))
+    CONVERSATION_DB_PATH = get_env("CONVERSATION_DB_PATH", "")
+    CONVERSATION_FLUSH_INTERVAL = float(get_env("CONVERSATION_FLUSH_INTERVAL", "5"))
     
     # LLM (Language Learning Model) Configuration
     LLM = get_env("LLM")
     LLM_TYPE, LLM_MODEL = LLM.split("/")
     LOCAL_LLM_URL = get_env("LOCAL_LLM_URL")
+    # Ordered fallback list of type/model providers, the first healthy one serves each request
+    LLM_PROVIDERS = [spec.strip() for spec in get_env("LLM_PROVIDERS", LLM).split(",") if spec.strip()]
+    HEDGE_PERCENTILE = float(get_env("HEDGE_PERCENTILE", "95"))
+    PROVIDER_ERROR_THRESHOLD = float(get_env("PROVIDER_ERROR_THRESHOLD", "0.5"))
+    PROVIDER_COOLDOWN = float(get_env("PROVIDER_COOLDOWN", "30"))
     SYSTEM_PROMPT = get_env("LLM_SYSTEM_PROMPT")
     
     # API Keys
@@ -71,16 +87,48 @@ class Config:
     TTS_ENABLED = get_env("TTS_ENABLED").lower() == "true"
     TTS_MODEL = get_env("TTS_MODEL")
     TTS_VOICE = get_env("TTS_VOICE")
-    TTS_FILENAME = get_env("TTS_FILENAME")
+    TTS_CONCURRENCY = int(get_env("TTS_CONCURRENCY", "3"))
+    TTS_MAX_QUEUE = int(get_env("TTS_MAX_QUEUE", "3"))
+    
+    # Trivia Configuration
+    TRIVIA_DB_PATH = get_env("TRIVIA_DB_PATH", "./trivia_questions.sqlite3")
+    TRIVIA_MIN_FRESH_QUESTIONS = int(get_env("TRIVIA_MIN_FRESH_QUESTIONS", "10"))
     
     # Rate Limiting
     MAX_REQUESTS_PER_MINUTE = int(get_env("MAX_REQUESTS_PER_MINUTE"))
     REQUEST_WINDOW = int(get_env("REQUEST_WINDOW"))
+    LLM_MAX_CONCURRENCY = int(get_env("LLM_MAX_CONCURRENCY", "4"))
+    USER_REQUESTS_PER_MINUTE = float(get_env("USER_REQUESTS_PER_MINUTE", "10"))
+    GUILD_REQUESTS_PER_MINUTE = float(get_env("GUILD_REQUESTS_PER_MINUTE", "30"))
+    PROVIDER_REQUESTS_PER_MINUTE = float(get_env("PROVIDER_REQUESTS_PER_MINUTE", "0"))
+    PROVIDER_TOKENS_PER_MINUTE = float(get_env("PROVIDER_TOKENS_PER_MINUTE", "0"))
+    CHANNEL_SEND_RATE = float(get_env("CHANNEL_SEND_RATE", "1"))
+    CHANNEL_SEND_BURST = int(get_env("CHANNEL_SEND_BURST", "5"))
     
     # Grounding Configuration
     USE_GROUNDING = get_env("USE_GROUNDING").lower() == "true"
     GROUNDING_SOURCE = get_env("GROUNDING_SOURCE")
     GROUNDING_PATH = get_env("GROUNDING_PATH")
+    GROUNDING_DOWNLOAD_CONCURRENCY = int(get_env("GROUNDING_DOWNLOAD_CONCURRENCY", "8"))
+    GROUNDING_PARSE_WORKERS = int(get_env("GROUNDING_PARSE_WORKERS", str(os.cpu_count() or 1)))
+    RAG_MAX_CONCURRENT_QUERIES = int(get_env("RAG_MAX_CONCURRENT_QUERIES", "4"))
+    RAG_MODE = get_env("RAG_MODE", "retrieval").lower()
+    RAG_TOP_K = int(get_env("RAG_TOP_K", "5"))
+    RAG_MIN_TERM_IDF = float(get_env("RAG_MIN_TERM_IDF", "0.3"))
+    CHUNK_MAX_TOKENS = int(get_env("CHUNK_MAX_TOKENS", "200"))
+    CHUNK_OVERLAP_TOKENS = int(get_env("CHUNK_OVERLAP_TOKENS", "40"))
+    CHUNK_DEDUP_DISTANCE = int(get_env("CHUNK_DEDUP_DISTANCE", "6"))
+    RAG_RETRIEVER = get_env("RAG_RETRIEVER", "vector").lower()
+    EMBEDDING_PROVIDER = get_env("EMBEDDING_PROVIDER", "openai").lower()
+    EMBEDDING_MODEL = get_env("EMBEDDING_MODEL", "text-embedding-ada-002")
+    LOCAL_EMBEDDING_MODEL = get_env("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    EMBEDDING_CACHE_DIR = get_env("EMBEDDING_CACHE_DIR", "./embedding_cache")
+    CHROMA_PERSIST_DIR = get_env("CHROMA_PERSIST_DIR", "./chroma_db")
+    VECTOR_STORE = get_env("VECTOR_STORE", "chroma").lower()
+    VECTOR_STORE_DTYPE = get_env("VECTOR_STORE_DTYPE", "float16").lower()
+    # Cosine similarity; ada-002 scores even unrelated texts around 0.7, newer and local models much lower
+    RAG_MIN_RELEVANCE = float(get_env("RAG_MIN_RELEVANCE", "") or (
+        "0.78" if EMBEDDING_PROVIDER == "openai" and EMBEDDING_MODEL == "text-embedding-ada-002" else "0.3"))
     
     # AWS Configuration (for S3 grounding)
     AWS_ACCESS_KEY_ID = get_env("AWS_ACCESS_KEY_ID")
@@ -99,6 +147,41 @@ class Config:
         """
         if cls.USE_GROUNDING and cls.GROUNDING_SOURCE not in ['local', 's3', 'azure']:
             raise ConfigError(f"Invalid GROUNDING_SOURCE: {cls.GROUNDING_SOURCE}")
+        if cls.RAG_MODE not in ['retrieval', 'synthesize']:
+            raise ConfigError(f"Invalid RAG_MODE: {cls.RAG_MODE}")
+        if cls.RAG_RETRIEVER not in ['vector', 'bm25', 'hybrid']:
+            raise ConfigError(f"Invalid RAG_RETRIEVER: {cls.RAG_RETRIEVER}")
+        if cls.VECTOR_STORE not in ['chroma', 'mmap']:
+            raise ConfigError(f"Invalid VECTOR_STORE: {cls.VECTOR_STORE}")
+        if cls.VECTOR_STORE_DTYPE not in ['float16', 'int8']:
+            raise ConfigError(f"Invalid VECTOR_STORE_DTYPE: {cls.VECTOR_STORE_DTYPE}")
+        if cls.EMBEDDING_PROVIDER not in ['openai', 'local']:
+            raise ConfigError(f"Invalid EMBEDDING_PROVIDER: {cls.EMBEDDING_PROVIDER}")
+        if not cls.LLM_PROVIDERS:
+            raise ConfigError("LLM_PROVIDERS must name at least one provider")
+        for spec in cls.LLM_PROVIDERS:
+            if spec.split("/", 1)[0] not in ['openai', 'anthropic', 'local'] or "/" not in spec:
+                raise ConfigError(f"Invalid LLM provider: {spec}")
+        if cls.TTS_CONCURRENCY <= 0:
+            raise ConfigError("TTS_CONCURRENCY must be positive")
+        if cls.TTS_MAX_QUEUE <= 0:
+            raise ConfigError("TTS_MAX_QUEUE must be positive")
+        if cls.TRIVIA_MIN_FRESH_QUESTIONS < 0:
+            raise ConfigError("TRIVIA_MIN_FRESH_QUESTIONS must not be negative")
+        if cls.CHANNEL_SEND_RATE <= 0 or cls.CHANNEL_SEND_BURST <= 0:
+            raise ConfigError("CHANNEL_SEND_RATE and CHANNEL_SEND_BURST must be positive")
+        if cls.LLM_MAX_CONCURRENCY <= 0:
+            raise ConfigError("LLM_MAX_CONCURRENCY must be positive")
+        if cls.CONVERSATION_MAX_CHANNELS <= 0:
+            raise ConfigError("CONVERSATION_MAX_CHANNELS must be positive")
+        if cls.CONTEXT_TOKEN_BUDGET <= 0:
+            raise ConfigError("CONTEXT_TOKEN_BUDGET must be positive")
+        if cls.CHUNK_MAX_TOKENS <= 0 or not 0 <= cls.CHUNK_OVERLAP_TOKENS < cls.CHUNK_MAX_TOKENS:
+            raise ConfigError("CHUNK_OVERLAP_TOKENS must be at least 0 and smaller than CHUNK_MAX_TOKENS")
+        if not 0 <= cls.RAG_MIN_TERM_IDF <= 1:
+            raise ConfigError("RAG_MIN_TERM_IDF must be between 0 and 1")
+        if not 0 <= cls.RAG_MIN_RELEVANCE <= 1:
+            raise ConfigError("RAG_MIN_RELEVANCE must be between 0 and 1")
         
         # Add more validation checks as needed
 
@@ -0,0 +1,60 @@
+import os
+import sys
+import tempfile
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Config reads its settings on import, so the required ones get placeholder values
+# and everything written to disk goes to a scratch directory
+SCRATCH_DIR = tempfile.mkdtemp(prefix="bot-tests-")
+TEST_ENVIRONMENT = {
+    "DISCORD_BOT_TOKEN": "test-token",
+    "DISCORD_APPLICATION_ID": "1",
+    "DISCORD_STATUS_MESSAGE": "Testing",
+    "MAX_TEXT": "1900",
+    "MAX_IMAGES": "1",
+    "MAX_MESSAGES": "10",
+    "LLM": "openai/gpt-4o",
+    "LOCAL_LLM_URL": "http://localhost:8000",
+    "LLM_SYSTEM_PROMPT": "You are a test assistant.",
+    "OPENAI_API_KEY": "sk-test",
+    "ANTHROPIC_API_KEY": "test",
+    "LLM_SETTINGS": "max_tokens=150,temperature=0.7",
+    "BOT_PREFIX": "!",
+    "COOLDOWN_RATE": "1",
+    "COOLDOWN_PER": "5",
+    "TTS_ENABLED": "false",
+    "TTS_MODEL": "tts-1",
+    "TTS_VOICE": "alloy",
+    "MAX_REQUESTS_PER_MINUTE": "60",
+    "REQUEST_WINDOW": "60",
+    "USE_GROUNDING": "true",
+    "GROUNDING_SOURCE": "local",
+    "GROUNDING_PATH": os.path.join(SCRATCH_DIR, "grounding"),
+    "AWS_ACCESS_KEY_ID": "test",
+    "AWS_SECRET_ACCESS_KEY": "test",
+    "AWS_BUCKET_NAME": "test-bucket",
+    "AZURE_STORAGE_CONNECTION_STRING": "UseDevelopmentStorage=true",
+    "AZURE_CONTAINER_NAME": "test-container",
+    "RAG_RETRIEVER": "bm25",
+    "CHROMA_PERSIST_DIR": os.path.join(SCRATCH_DIR, "index"),
+    "EMBEDDING_CACHE_DIR": os.path.join(SCRATCH_DIR, "embedding_cache"),
+    "TRIVIA_DB_PATH": os.path.join(SCRATCH_DIR, "trivia.sqlite3"),
+}
+for key, value in TEST_ENVIRONMENT.items():
+    os.environ.setdefault(key, value)
+
+class WhitespaceEncoding:
+    """Counts words as tokens, so tests run without downloading the tiktoken vocabulary."""
+    def encode(self, text, **kwargs):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+@pytest.fixture(autouse=True)
+def offline_tokenizer(monkeypatch):
+    from utils import chunking
+    monkeypatch.setattr(chunking, "get_encoding", lambda: WhitespaceEncoding())
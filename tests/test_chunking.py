@@ -0,0 +1,44 @@
+from utils.chunking import NearDuplicateIndex, chunk_text, count_tokens, simhash
+
+def sentence(index: int, words: int = 5) -> str:
+    return " ".join(f"s{index}w{i}" for i in range(words - 1)) + f" s{index}end."
+
+def test_chunks_end_at_sentence_boundaries_within_the_budget():
+    text = " ".join(sentence(i) for i in range(6))
+    chunks = chunk_text(text, max_tokens=12, overlap_tokens=0)
+    assert [chunk for chunk, _ in chunks] == [f"{sentence(i)} {sentence(i + 1)}" for i in range(0, 6, 2)]
+    for chunk, start in chunks:
+        assert text[start:start + len(chunk)] == chunk
+        assert count_tokens(chunk) <= 12
+
+def test_overlap_repeats_the_trailing_sentence():
+    text = " ".join(sentence(i) for i in range(4))
+    chunks = [chunk for chunk, _ in chunk_text(text, max_tokens=10, overlap_tokens=5)]
+    assert chunks == [f"{sentence(0)} {sentence(1)}", f"{sentence(1)} {sentence(2)}", f"{sentence(2)} {sentence(3)}"]
+
+def test_overlong_sentence_is_split_between_words():
+    text = sentence(0, words=25)
+    chunks = [chunk for chunk, _ in chunk_text(text, max_tokens=10, overlap_tokens=0)]
+    assert [count_tokens(chunk) for chunk in chunks] == [10, 10, 5]
+    assert " ".join(chunks) == text
+
+def test_paragraph_breaks_end_segments():
+    chunks = chunk_text("First heading\n\nSome body text\nmore", max_tokens=3, overlap_tokens=0)
+    assert [chunk.strip() for chunk, _ in chunks] == ["First heading", "Some body text", "more"]
+    assert [start for _, start in chunks] == [0, 15, 30]
+
+def test_near_duplicates_are_found_and_forgotten():
+    base = " ".join(f"word{i}" for i in range(60))
+    edited = base.replace("word30", "changed")
+    unrelated = " ".join(f"other{i}" for i in range(60))
+    index = NearDuplicateIndex(max_distance=6)
+    index.add("a", simhash(base), "a.txt")
+    assert simhash(base) == simhash(base.upper())
+    assert index.find(simhash(edited)) == "a"
+    assert index.sources["a"] == "a.txt"
+    assert index.find(simhash(unrelated)) is None
+    # A chunk is never its own duplicate
+    assert index.find(simhash(base), exclude="a") is None
+    index.remove("a")
+    assert index.find(simhash(base)) is None
+    assert not index.buckets and not index.sources
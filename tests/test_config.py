@@ -0,0 +1,14 @@
+import pytest
+from config import Config, ConfigError
+
+def test_empty_provider_list_is_rejected(monkeypatch):
+    monkeypatch.setattr(Config, "LLM_PROVIDERS", [])
+    with pytest.raises(ConfigError, match="LLM_PROVIDERS"):
+        Config.validate()
+
+def test_provider_specs_need_a_known_type(monkeypatch):
+    monkeypatch.setattr(Config, "LLM_PROVIDERS", ["openai/gpt-4o", "gpt-4o"])
+    with pytest.raises(ConfigError, match="gpt-4o"):
+        Config.validate()
+    monkeypatch.setattr(Config, "LLM_PROVIDERS", ["openai/gpt-4o", "local/llama"])
+    Config.validate()
@@ -0,0 +1,93 @@
+import asyncio
+import types
+import pytest
+from utils import context, llm_utils
+from utils.context import ConversationSummarizer, fit_history
+
+def turn(index: int, content: str = "") -> dict:
+    return {"role": "user", "content": content or f"message {index}", "timestamp": float(index + 1)}
+
+class FakeLLM:
+    """Records every summary prompt; answers after a short delay, or fails while failing is set."""
+    def __init__(self, monkeypatch):
+        self.prompts = []
+        self.failing = False
+
+        async def prepare_completion(bot, messages, **kwargs):
+            return {"messages": messages}
+
+        async def rate_limited_completion(bot, **kwargs):
+            self.prompts.append(kwargs["messages"][0]["content"])
+            await asyncio.sleep(0.05)
+            if self.failing:
+                raise RuntimeError("provider down")
+            message = types.SimpleNamespace(content=f"summary {len(self.prompts)}")
+            return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+        monkeypatch.setattr(llm_utils, "prepare_completion", prepare_completion)
+        monkeypatch.setattr(llm_utils, "rate_limited_completion", rate_limited_completion)
+
+    def summarized(self, index: int) -> int:
+        """How many prompts asked to fold in the given turn."""
+        return sum(f"user: message {index}\n" in prompt + "\n" for prompt in self.prompts)
+
+@pytest.fixture
+def llm(monkeypatch):
+    return FakeLLM(monkeypatch)
+
+async def settle(summarizer: ConversationSummarizer):
+    while summarizer.tasks:
+        await asyncio.gather(*summarizer.tasks.values(), return_exceptions=True)
+
+def test_fit_history_keeps_newest_turns_within_budget():
+    messages = [turn(i, "word " * 10) for i in range(5)]
+    kept, dropped = fit_history(messages, budget=30)
+    assert [message["content"] for message in kept] == [messages[-2]["content"], messages[-1]["content"]]
+    assert dropped == messages[:3]
+    # The newest turn is kept even when it alone is over budget
+    kept, dropped = fit_history(messages, budget=1)
+    assert len(kept) == 1 and len(dropped) == 4
+
+def test_turns_being_summarized_are_not_queued_again(llm):
+    async def run():
+        summarizer = ConversationSummarizer()
+        turns = [turn(i) for i in range(6)]
+        summarizer.update(None, 1, turns[:5])
+        await asyncio.sleep(0.01)
+        # The next prompt is built while the first summary is still being written
+        summarizer.update(None, 1, turns)
+        await settle(summarizer)
+        assert [llm.summarized(i) for i in range(6)] == [1] * 6
+        assert summarizer.get(1) == "summary 2"
+
+    asyncio.run(run())
+
+def test_failed_summary_is_retried_with_the_next_update(llm):
+    async def run():
+        summarizer = ConversationSummarizer()
+        llm.failing = True
+        summarizer.update(None, 1, [turn(0), turn(1)])
+        await settle(summarizer)
+        assert summarizer.get(1) == ""
+        llm.failing = False
+        summarizer.update(None, 1, [turn(0), turn(1), turn(2)])
+        await settle(summarizer)
+        assert "message 0" in llm.prompts[-1] and "message 2" in llm.prompts[-1]
+        assert summarizer.get(1) == "summary 2"
+
+    asyncio.run(run())
+
+def test_clear_cancels_the_running_update(llm):
+    async def run():
+        summarizer = ConversationSummarizer()
+        summarizer.update(None, 1, [turn(0)])
+        await asyncio.sleep(0.01)
+        summarizer.clear(1)
+        await asyncio.sleep(0.1)
+        assert summarizer.get(1) == ""
+        # A cleared channel starts over, so its turns are summarized again
+        summarizer.update(None, 1, [turn(0)])
+        await settle(summarizer)
+        assert summarizer.get(1) == "summary 2"
+
+    asyncio.run(run())
@@ -0,0 +1,38 @@
+import asyncio
+from utils.conversation import ConversationStore
+
+def test_clear_then_get_does_not_reload_flushed_turns(tmp_path):
+    async def run():
+        store = ConversationStore(max_messages=10, max_channels=10, ttl=3600,
+                                  db_path=str(tmp_path / "conversations.sqlite3"), flush_interval=60)
+        await store.append(1, "user", "hello secret")
+        await store.flush()
+        assert await store.clear(1)
+        assert [turn.content for turn in await store.get(1)] == []
+        await store.flush()
+        assert [turn.content for turn in await store.get(1)] == []
+        # Evicted from memory, the channel is read back from the database
+        store.evict(1)
+        assert [turn.content for turn in await store.get(1)] == []
+        await store.close()
+
+    asyncio.run(run())
+
+def test_clear_of_evicted_channel_before_flush(tmp_path):
+    async def run():
+        store = ConversationStore(max_messages=10, max_channels=10, ttl=3600,
+                                  db_path=str(tmp_path / "conversations.sqlite3"), flush_interval=60)
+        await store.append(1, "user", "hello secret")
+        await store.flush()
+        await store.clear(1)
+        store.evict(1)
+        assert [turn.content for turn in await store.get(1)] == []
+        await store.append(1, "user", "after clear")
+        await store.close()
+
+        reopened = ConversationStore(max_messages=10, max_channels=10, ttl=3600,
+                                     db_path=str(tmp_path / "conversations.sqlite3"))
+        assert [turn.content for turn in await reopened.get(1)] == ["after clear"]
+        await reopened.close()
+
+    asyncio.run(run())
@@ -0,0 +1,210 @@
+import io
+import os
+import time
+import types
+import asyncio
+import threading
+import pytest
+from config import Config
+from utils import grounding_utils, rag_utils
+from utils.rag_utils import RAGSystem
+
+ALPHA = "The alpha factory produces widgets every morning."
+BETA = "The beta garden grows flowers in the spring."
+
+@pytest.fixture
+def grounding(tmp_path, monkeypatch):
+    """A local grounding source and an empty BM25 index, both under tmp_path."""
+    source = tmp_path / "source"
+    source.mkdir()
+    monkeypatch.setattr(Config, "GROUNDING_SOURCE", "local")
+    monkeypatch.setattr(Config, "GROUNDING_PATH", str(source))
+    monkeypatch.setattr(Config, "CHROMA_PERSIST_DIR", str(tmp_path / "index"))
+    monkeypatch.setattr(Config, "RAG_RETRIEVER", "bm25")
+    monkeypatch.setattr(Config, "GROUNDING_PARSE_WORKERS", 1)
+    system = RAGSystem()
+    monkeypatch.setattr(rag_utils, "rag_system", system)
+    monkeypatch.setattr(grounding_utils, "rag_system", system)
+    return source, system
+
+def write(source, name: str, content: str):
+    path = source / name
+    path.write_text(content, encoding="utf-8")
+    # Edits within the same clock tick must still look modified
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+def retrieve(system, question: str):
+    return sorted({chunk["source"] for chunk in asyncio.run(system.retrieve(question))})
+
+def test_changes_and_removals_are_synced(grounding):
+    source, system = grounding
+    write(source, "a.txt", ALPHA)
+    write(source, "b.txt", BETA)
+    report = grounding_utils.load_grounding_data()
+    assert sorted(report["added"]) == ["a.txt", "b.txt"]
+
+    report = grounding_utils.load_grounding_data()
+    assert report["added"] == report["changed"] == report["removed"] == []
+    assert report["unchanged"] == 2
+
+    write(source, "a.txt", "The alpha factory now builds gadgets.")
+    os.remove(source / "b.txt")
+    report = grounding_utils.load_grounding_data()
+    assert report["changed"] == ["a.txt"] and report["removed"] == ["b.txt"]
+    assert system.sources() == {"a.txt"}
+    assert retrieve(system, "beta garden flowers") == []
+
+def test_switching_source_drops_the_old_chunks(grounding, tmp_path, monkeypatch):
+    source, system = grounding
+    write(source, "a.txt", ALPHA)
+    grounding_utils.load_grounding_data()
+
+    other = tmp_path / "other"
+    other.mkdir()
+    write(other, "b.txt", BETA)
+    monkeypatch.setattr(Config, "GROUNDING_PATH", str(other))
+    report = grounding_utils.load_grounding_data()
+    assert report["removed"] == ["a.txt"]
+    assert system.sources() == {"b.txt"}
+    assert retrieve(system, "alpha factory") == []
+
+def test_duplicate_file_is_reindexed_when_its_kept_copy_is_removed(grounding):
+    source, system = grounding
+    write(source, "a.txt", ALPHA)
+    write(source, "b.txt", ALPHA)
+    grounding_utils.load_grounding_data()
+    # Only one copy of the identical text is indexed
+    assert len(system.sources()) == 1
+    kept = system.sources().pop()
+    duplicate = "b.txt" if kept == "a.txt" else "a.txt"
+
+    os.remove(source / kept)
+    grounding_utils.load_grounding_data()
+    assert system.sources() == {duplicate}
+    assert retrieve(system, "alpha factory widgets") == [duplicate]
+
+def test_duplicate_file_is_reindexed_when_its_kept_copy_changes(grounding):
+    source, system = grounding
+    write(source, "a.txt", ALPHA)
+    write(source, "b.txt", ALPHA)
+    grounding_utils.load_grounding_data()
+    kept = system.sources().pop()
+    duplicate = "b.txt" if kept == "a.txt" else "a.txt"
+
+    write(source, kept, BETA)
+    grounding_utils.load_grounding_data()
+    assert system.sources() == {"a.txt", "b.txt"}
+    assert retrieve(system, "alpha factory widgets") == [duplicate]
+    # The dependency is gone, so a further reload leaves everything alone
+    report = grounding_utils.load_grounding_data()
+    assert report["unchanged"] == 2 and system.sources() == {"a.txt", "b.txt"}
+
+def test_gate_ignores_words_found_in_every_chunk(grounding):
+    source, system = grounding
+    for index, topic in enumerate(["widgets", "flowers", "engines", "rivers"]):
+        write(source, f"{index}.txt", f"The bot answers questions about {topic}.")
+    grounding_utils.load_grounding_data()
+    assert system.has_term_overlap("Tell me about rivers")
+    assert not system.has_term_overlap("Can the bot answers questions?")
+    assert not system.has_term_overlap("completely unrelated")
+    assert retrieve(system, "what questions can the bot answer") == []
+
+class FakeS3:
+    """Stands in for an S3 client: lists a few keys per page and records concurrent downloads."""
+    def __init__(self, objects, page_size=2, delay=0.05):
+        self.objects = objects
+        self.page_size = page_size
+        self.delay = delay
+        self.pages = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def get_paginator(self, operation):
+        assert operation == "list_objects_v2"
+        return self
+
+    def paginate(self, Bucket):
+        keys = sorted(self.objects)
+        for start in range(0, len(keys), self.page_size):
+            self.pages += 1
+            yield {"Contents": [{"Key": key, "Size": len(self.objects[key]), "ETag": f'"{hash(self.objects[key])}"'}
+                                for key in keys[start:start + self.page_size]]}
+
+    def get_object(self, Bucket, Key):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+def s3_page(keys, token=None):
+    page = {"IsTruncated": token is not None, "KeyCount": len(keys),
+            "Contents": [{"Key": key, "Size": 10, "ETag": f'"{key}"'} for key in keys]}
+    if token is not None:
+        page["NextContinuationToken"] = token
+    return page
+
+def test_s3_listing_follows_continuation_tokens(monkeypatch):
+    import boto3
+    from botocore.stub import Stubber
+    client = boto3.client("s3", region_name="us-east-1", aws_access_key_id="test", aws_secret_access_key="test")
+    stubber = Stubber(client)
+    stubber.add_response("list_objects_v2", s3_page(["a.txt", "image.png"], token="page-2"), {"Bucket": "test-bucket"})
+    stubber.add_response("list_objects_v2", s3_page(["b.PDF", "c.docx"]),
+                         {"Bucket": "test-bucket", "ContinuationToken": "page-2"})
+    monkeypatch.setattr(Config, "AWS_BUCKET_NAME", "test-bucket")
+    monkeypatch.setattr(grounding_utils, "get_s3_client", lambda: client)
+    with stubber:
+        entries = grounding_utils.list_s3_grounding_objects()
+        stubber.assert_no_pending_responses()
+    assert [entry["path"] for entry in entries] == ["a.txt", "b.PDF", "c.docx"]
+    assert entries[0] == {"path": "a.txt", "size": 10, "version": '"a.txt"'}
+
+def test_azure_listing_reads_every_page(monkeypatch):
+    from azure.core.paging import ItemPaged
+    pages = {None: (["a.txt", "skip.bin"], "page-2"), "page-2": (["b.docx"], None)}
+
+    class Container:
+        def list_blobs(self):
+            def get_next(token):
+                return pages[token]
+
+            def extract_data(page):
+                names, token = page
+                return token, iter(types.SimpleNamespace(name=name, size=5, etag=f"etag-{name}") for name in names)
+
+            return ItemPaged(get_next, extract_data)
+
+    monkeypatch.setattr(grounding_utils, "get_azure_container_client", lambda: Container())
+    entries = grounding_utils.list_azure_grounding_blobs()
+    assert [entry["path"] for entry in entries] == ["a.txt", "b.docx"]
+    assert entries[1]["version"] == "etag-b.docx"
+
+def test_s3_files_are_fetched_concurrently_within_the_limit(grounding, monkeypatch):
+    _, system = grounding
+    s3 = FakeS3({f"doc{i}.txt": f"Document {i} talks about topic{i}.".encode() for i in range(10)})
+    s3.objects["broken.txt"] = b"never read"
+    monkeypatch.setattr(Config, "GROUNDING_SOURCE", "s3")
+    monkeypatch.setattr(Config, "GROUNDING_DOWNLOAD_CONCURRENCY", 3)
+    monkeypatch.setattr(grounding_utils, "get_s3_client", lambda: s3)
+    get_object = s3.get_object
+
+    def fetch(Bucket, Key):
+        if Key == "broken.txt":
+            raise ConnectionError("reset by peer")
+        return get_object(Bucket, Key)
+
+    monkeypatch.setattr(s3, "get_object", fetch)
+    report = grounding_utils.load_grounding_data()
+    assert s3.pages == 6
+    assert s3.max_in_flight == 3
+    # A failed download only leaves that file out, and it is tried again on the next load
+    assert sorted(report["added"]) == sorted(f"doc{i}.txt" for i in range(10))
+    assert system.sources() == {f"doc{i}.txt" for i in range(10)}
+    assert retrieve(system, "topic7") == ["doc7.txt"]
+    monkeypatch.setattr(s3, "get_object", get_object)
+    assert grounding_utils.load_grounding_data()["added"] == ["broken.txt"]
@@ -0,0 +1,97 @@
+import sys
+import time
+import types
+import asyncio
+import pytest
+from config import Config
+from utils.providers import MAX_CONSECUTIVE_FAILURES, MIN_HEDGE_SAMPLES, ProviderPool
+from utils.rate_limiter import RateLimiter
+
+class StandInProviders:
+    """Replaces litellm.acompletion with backends that answer after a set delay or fail."""
+    def __init__(self, monkeypatch):
+        self.delays = {}
+        self.failing = set()
+        self.calls = []
+        self.cancelled = []
+        monkeypatch.setitem(sys.modules, "litellm", types.SimpleNamespace(acompletion=self.acompletion))
+        monkeypatch.setattr(Config, "HEDGE_PERCENTILE", 95.0)
+
+    async def acompletion(self, model, **kwargs):
+        self.calls.append(model)
+        try:
+            await asyncio.sleep(self.delays.get(model, 0))
+        except asyncio.CancelledError:
+            self.cancelled.append(model)
+            raise
+        if model in self.failing:
+            raise ConnectionError(f"{model} is down")
+        if kwargs.get("stream"):
+            return self.stream(model)
+        return f"answer from {model}"
+
+    async def stream(self, model):
+        yield f"streamed from {model}"
+
+@pytest.fixture
+def backends(monkeypatch):
+    return StandInProviders(monkeypatch)
+
+def warm_up(pool, latency=0.01):
+    """Give the primary enough latency samples to hedge on."""
+    for _ in range(MIN_HEDGE_SAMPLES):
+        pool.providers[0].record_success(latency)
+
+def test_failed_request_fails_over_to_the_next_provider(backends):
+    pool = ProviderPool(["openai/primary", "anthropic/secondary"])
+    backends.failing.add("primary")
+    assert asyncio.run(pool.complete(messages=[])) == "answer from secondary"
+    assert backends.calls == ["primary", "secondary"]
+    assert pool.providers[0].consecutive_failures == 1
+
+def test_all_providers_failing_raises_the_last_error(backends):
+    pool = ProviderPool(["openai/primary", "anthropic/secondary"])
+    backends.failing.update({"primary", "secondary"})
+    with pytest.raises(ConnectionError, match="secondary"):
+        asyncio.run(pool.complete(messages=[]))
+
+def test_provider_is_skipped_after_repeated_failures(backends):
+    pool = ProviderPool(["openai/primary", "anthropic/secondary"])
+    backends.failing.add("primary")
+    for _ in range(MAX_CONSECUTIVE_FAILURES):
+        asyncio.run(pool.complete(messages=[]))
+    backends.calls.clear()
+    assert asyncio.run(pool.complete(messages=[])) == "answer from secondary"
+    assert backends.calls == ["secondary"]
+
+def test_slow_request_is_hedged_on_the_next_provider(backends):
+    pool = ProviderPool(["openai/primary", "anthropic/secondary"])
+    warm_up(pool)
+    backends.delays["primary"] = 1.0
+    start = time.monotonic()
+    assert asyncio.run(pool.complete(messages=[])) == "answer from secondary"
+    assert time.monotonic() - start < 0.5
+    # The losing request is cancelled rather than left running
+    assert backends.cancelled == ["primary"]
+
+def test_no_hedge_without_provider_budget(backends):
+    limiter = RateLimiter(user_rpm=0, guild_rpm=0, global_rpm=0, window=60, provider_rpm=1)
+    assert limiter.try_acquire_provider()
+    pool = ProviderPool(["openai/primary", "anthropic/secondary"], rate_limiter=limiter)
+    warm_up(pool)
+    backends.delays["primary"] = 0.1
+    assert asyncio.run(pool.complete(messages=[])) == "answer from primary"
+    assert backends.calls == ["primary"]
+
+def test_stream_fails_over_but_is_never_hedged(backends):
+    pool = ProviderPool(["openai/primary", "anthropic/secondary"])
+    warm_up(pool)
+    backends.delays["primary"] = 0.1
+
+    async def read(**kwargs):
+        return [chunk async for chunk in await pool.complete(stream=True, messages=[], **kwargs)]
+
+    assert asyncio.run(read()) == ["streamed from primary"]
+    assert backends.calls == ["primary"]
+    backends.failing.add("primary")
+    assert asyncio.run(read()) == ["streamed from secondary"]
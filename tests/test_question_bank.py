@@ -0,0 +1,50 @@
+import asyncio
+import sqlite3
+from utils.question_bank import QuestionBank
+
+def question(index: int):
+    return (f"Question number {index}?", ["a", "b", "c", "d"], "A")
+
+def test_questions_queued_by_a_game_are_reserved_until_it_ends(tmp_path):
+    async def run():
+        bank = QuestionBank(str(tmp_path / "trivia.sqlite3"), min_fresh=0)
+        await bank.add("Space", [question(i) for i in range(4)])
+        first = await bank.take("space", 3, "game 1")
+        assert len(first) == 3
+        assert await bank.fresh_count("space") == 1
+        # A second game running at the same time gets the one question left
+        assert await bank.take("space", 3, "game 2") == [q for q in map(question, range(4)) if q not in first]
+        assert await bank.fresh_count("space") == 0
+
+        await bank.mark_asked("space", first[0][0])
+        await bank.release("game 1")
+        # The questions the first game never posted are fresh again
+        assert await bank.fresh_count("space") == 2
+        assert sorted(await bank.take("space", 5, "game 3")) == sorted(first[1:])
+        await bank.close()
+
+    asyncio.run(run())
+
+def test_generated_questions_are_reserved_and_old_databases_upgraded(tmp_path):
+    path = tmp_path / "trivia.sqlite3"
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE questions (topic TEXT NOT NULL, hash TEXT NOT NULL, question TEXT NOT NULL, "
+        "options TEXT NOT NULL, answer TEXT NOT NULL, times_asked INTEGER NOT NULL DEFAULT 0, "
+        "last_asked REAL NOT NULL DEFAULT 0, PRIMARY KEY (topic, hash))"
+    )
+    db.commit()
+    db.close()
+
+    async def run():
+        bank = QuestionBank(str(path), min_fresh=0)
+        assert await bank.add("space", [question(0), question(1)], "game 1") == [question(0), question(1)]
+        await bank.add("space", [question(2)])
+        assert await bank.fresh_count("space") == 1
+        await bank.close()
+        # Reservations of games that were running when the bot stopped do not outlive it
+        reopened = QuestionBank(str(path), min_fresh=0)
+        assert await reopened.fresh_count("space") == 3
+        await reopened.close()
+
+    asyncio.run(run())
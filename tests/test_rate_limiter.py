@@ -0,0 +1,81 @@
+import asyncio
+from utils.rate_limiter import RateLimiter, TokenBucket
+from utils.scheduler import Priority
+
+def test_interactive_requests_overtake_waiting_background_ones():
+    async def run():
+        limiter = RateLimiter(user_rpm=0, guild_rpm=0, global_rpm=1, window=0.05)
+        await limiter.acquire()
+        order = []
+
+        async def request(name, priority):
+            await limiter.acquire(priority=priority)
+            order.append(name)
+
+        background = [asyncio.create_task(request(f"background {i}", Priority.BACKGROUND)) for i in range(3)]
+        await asyncio.sleep(0.01)
+        interactive = asyncio.create_task(request("interactive", Priority.INTERACTIVE))
+        await asyncio.gather(*background, interactive)
+        assert order[0] == "interactive"
+        assert order[1:] == ["background 0", "background 1", "background 2"]
+
+    asyncio.run(run())
+
+def test_cancelled_waiter_does_not_hold_up_the_queue():
+    async def run():
+        bucket = TokenBucket(capacity=1, rate=20)
+        await bucket.acquire()
+        cancelled = asyncio.create_task(bucket.acquire(priority=Priority.INTERACTIVE))
+        waiting = asyncio.create_task(bucket.acquire())
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        assert await asyncio.wait_for(waiting, 1) < 0.1
+        assert not bucket.waiting
+
+    asyncio.run(run())
+
+def test_bucket_serves_a_burst_then_waits_for_the_refill():
+    async def run():
+        bucket = TokenBucket(capacity=3, rate=20)
+        assert [await bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+        assert not bucket.try_acquire()
+        waited = await bucket.acquire()
+        assert 0.03 < waited < 0.2
+        # Requests larger than the bucket only wait for a full one
+        assert await bucket.acquire(10) < 0.3
+
+    asyncio.run(run())
+
+def test_adjust_returns_and_takes_tokens():
+    bucket = TokenBucket(capacity=100, rate=0.001)
+    assert bucket.try_acquire(60)
+    bucket.adjust(40)
+    assert bucket.try_acquire(80)
+    bucket.adjust(-50)
+    assert not bucket.try_acquire(1)
+
+def test_provider_token_budget_is_reconciled_with_reported_usage():
+    async def run():
+        limiter = RateLimiter(user_rpm=0, guild_rpm=0, global_rpm=0, window=60, provider_rpm=100, provider_tpm=1000)
+        await limiter.acquire(tokens=900)
+        assert not limiter.try_acquire_provider(tokens=500)
+        # The request taken for the refused hedge is given back
+        assert limiter.provider_requests.tokens > 98
+        limiter.reconcile(estimated_tokens=900, actual_tokens=300)
+        assert limiter.try_acquire_provider(tokens=500)
+
+    asyncio.run(run())
+
+def test_scoped_buckets_are_separate_and_bounded(monkeypatch):
+    from utils import rate_limiter
+    monkeypatch.setattr(rate_limiter, "MAX_SCOPED_BUCKETS", 2)
+    limiter = RateLimiter(user_rpm=1, guild_rpm=0, global_rpm=0, window=60)
+
+    async def run():
+        await limiter.acquire(user_id=1)
+        # Another user's bucket is still full
+        assert await asyncio.wait_for(limiter.acquire(user_id=2), 0.1) is None
+        await limiter.acquire(user_id=3)
+        assert list(limiter.user_buckets) == [2, 3]
+
+    asyncio.run(run())
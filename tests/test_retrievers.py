@@ -0,0 +1,46 @@
+from utils.retrievers import BM25Index, reciprocal_rank_fusion, tokenize
+
+TEXTS = {
+    "a": "The alpha factory produces widgets every morning.",
+    "b": "The beta garden grows flowers in the spring.",
+    "c": "Widgets and gadgets are sold in the beta shop.",
+}
+
+def make_index(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25.json"))
+    index.add(list(TEXTS), list(TEXTS.values()), [{"source": f"{cid}.txt"} for cid in TEXTS])
+    return index
+
+def test_tokenize_drops_case_punctuation_and_stopwords():
+    assert tokenize("The Alpha-factory, and THE widgets!") == ["alpha", "factory", "widgets"]
+
+def test_search_ranks_rarer_and_repeated_terms_higher(tmp_path):
+    index = make_index(tmp_path)
+    results = index.search("alpha widgets", k=3)
+    assert [result["id"] for result in results] == ["a", "c"]
+    assert results[0]["source"] == "a.txt" and results[0]["score"] > results[1]["score"] > 0
+    assert index.search("unknown words", k=3) == []
+
+def test_deleted_chunks_leave_no_postings_and_saved_index_reloads(tmp_path):
+    index = make_index(tmp_path)
+    index.delete(["c"])
+    assert {result["id"] for result in index.search("widgets gadgets beta", k=3)} == {"a", "b"}
+    assert "gadgets" not in index.postings
+    assert index.ids() == {"a", "b"} and index.sources() == {"a.txt", "b.txt"}
+    index.save()
+    reloaded = BM25Index(str(tmp_path / "bm25.json"))
+    assert reloaded.ids("b.txt") == {"b"}
+    assert reloaded.total_length == index.total_length
+
+def test_best_term_idf_is_relative_to_a_term_in_one_chunk(tmp_path):
+    index = make_index(tmp_path)
+    assert index.best_term_idf(["alpha"]) == 1.0
+    assert 0 < index.best_term_idf(["widgets", "beta"]) < 1.0
+    assert index.best_term_idf(["beta", "alpha"]) == 1.0
+    assert index.best_term_idf(["missing"]) == 0.0
+
+def test_rank_fusion_favours_chunks_found_by_both_retrievers():
+    chunk = lambda cid: {"id": cid}
+    fused = reciprocal_rank_fusion([[chunk("a"), chunk("b")], [chunk("c"), chunk("b")]])
+    assert [item["id"] for item in fused][0] == "b"
+    assert {item["id"] for item in fused} == {"a", "b", "c"}
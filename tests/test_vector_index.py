@@ -0,0 +1,52 @@
+import hashlib
+from typing import List
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from utils.vector_index import MmapVectorStore
+
+class HashEmbeddings(Embeddings):
+    """Deterministic embeddings: every distinct text gets its own direction."""
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:4], "big")
+        return np.random.default_rng(seed).standard_normal(16).tolist()
+
+def make_store(tmp_path, dtype="float16"):
+    return MmapVectorStore(str(tmp_path / "vectors"), HashEmbeddings(), dtype=dtype)
+
+def add(store, *names):
+    store.add(list(names), [f"text of {name}" for name in names], [{"source": f"{name}.txt"} for name in names])
+
+def test_search_finds_the_matching_chunk(tmp_path):
+    store = make_store(tmp_path)
+    add(store, "a", "b", "c")
+    document, score = store.similarity_search_with_score("text of b", k=1)[0]
+    assert document.page_content == "text of b"
+    assert score > 0.99
+
+def test_readding_a_deleted_chunk_stores_it_again(tmp_path):
+    store = make_store(tmp_path)
+    add(store, "a", "b", "c")
+    store.delete(["a"])
+    assert store.ids() == {"b", "c"}
+    add(store, "a")
+    assert store.ids() == {"a", "b", "c"}
+    assert store.sources() == {"a.txt", "b.txt", "c.txt"}
+    assert store.similarity_search("text of a", k=1)[0].page_content == "text of a"
+
+    reopened = make_store(tmp_path)
+    assert reopened.ids() == {"a", "b", "c"}
+    assert reopened.count() == 3
+
+def test_compaction_keeps_live_chunks(tmp_path):
+    store = make_store(tmp_path, dtype="int8")
+    add(store, "a", "b", "c", "d")
+    store.delete(["a", "b"])
+    add(store, "a")
+    store.delete(["c"])
+    assert store.ids() == {"a", "d"}
+    assert store.count() == 2
+    assert store.similarity_search("text of d", k=1)[0].page_content == "text of d"
+    assert make_store(tmp_path, dtype="int8").ids() == {"a", "d"}
@@ -1,11 +1,19 @@
-from .llm_utils import generate_response, handle_chat_message
-from .tts_utils import generate_tts, cleanup_tts_file
-from .grounding_utils import load_grounding_data
+import importlib
 
-__all__ = [
-    'generate_response',
-    'handle_chat_message',
-    'generate_tts',
-    'cleanup_tts_file',
-    'load_grounding_data'
-]
\ No newline at end of file
+# Exported names and their modules. They are imported on first access (PEP 562),
+# so importing one utils module does not load LangChain, litellm and every backend.
+_EXPORTS = {
+    'generate_response': '.llm_utils',
+    'handle_chat_message': '.llm_utils',
+    'SpeechPipeline': '.tts_utils',
+    'VoicePlayers': '.tts_utils',
+    'load_grounding_data': '.grounding_utils',
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(module, __name__), name)
@@ -0,0 +1,125 @@
+import re
+import hashlib
+import functools
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+import tiktoken
+
+ENCODING_NAME = "cl100k_base"
+# Sentence ends, or paragraph breaks, are the preferred places to cut a chunk
+SEGMENT_PATTERN = re.compile(r"[^\n.!?]*(?:[.!?]+[\"')\]]*|\n\s*\n|\n|$)")
+WORD_PATTERN = re.compile(r"\S+")
+SHINGLE_SIZE = 2
+
+@functools.lru_cache(maxsize=None)
+def get_encoding() -> tiktoken.Encoding:
+    return tiktoken.get_encoding(ENCODING_NAME)
+
+def count_tokens(text: str) -> int:
+    return len(get_encoding().encode(text, disallowed_special=()))
+
+def split_segments(text: str, max_tokens: int) -> List[Tuple[int, int, int]]:
+    """
+    Split text into (start, end, token count) spans at sentence and paragraph
+    boundaries. Sentences longer than max_tokens are split between words.
+    """
+    segments = []
+    for match in SEGMENT_PATTERN.finditer(text):
+        start, end = match.span()
+        # Leading whitespace belongs to no chunk, so offsets point at real text
+        while start < end and text[start].isspace():
+            start += 1
+        if start == end:
+            continue
+        tokens = count_tokens(text[start:end])
+        if tokens <= max_tokens:
+            segments.append((start, end, tokens))
+            continue
+        for word in WORD_PATTERN.finditer(text, start, end):
+            segments.append((word.start(), word.end(), count_tokens(word.group())))
+    return segments
+
+def chunk_text(text: str, max_tokens: int, overlap_tokens: int) -> List[Tuple[str, int]]:
+    """
+    Pack whole segments into chunks of at most max_tokens tokens, repeating up
+    to overlap_tokens tokens of trailing segments at the start of the next chunk.
+    Returns (chunk text, start offset in the original text) pairs.
+    """
+    segments = split_segments(text, max_tokens)
+    chunks = []
+    window: List[Tuple[int, int, int]] = []
+    window_tokens = 0
+    for segment in segments:
+        if window and window_tokens + segment[2] > max_tokens:
+            chunks.append((text[window[0][0]:window[-1][1]], window[0][0]))
+            # Carry the tail of the chunk over as overlap
+            overlap = []
+            overlap_total = 0
+            for previous in reversed(window):
+                if overlap_total + previous[2] > overlap_tokens or overlap_total + previous[2] + segment[2] > max_tokens:
+                    break
+                overlap.insert(0, previous)
+                overlap_total += previous[2]
+            window, window_tokens = overlap, overlap_total
+        window.append(segment)
+        window_tokens += segment[2]
+    if window:
+        chunks.append((text[window[0][0]:window[-1][1]], window[0][0]))
+    return chunks
+
+def simhash(text: str) -> int:
+    """64-bit SimHash over word shingles; near-identical texts differ in only a few bits."""
+    words = [word.lower() for word in WORD_PATTERN.findall(text)]
+    shingles = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1))]
+    weights = [0] * 64
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+class NearDuplicateIndex:
+    """
+    Finds SimHashes within max_distance bits of each other. The hash is cut
+    into max_distance + 1 bands; by the pigeonhole principle two hashes that
+    close share at least one band exactly, so only those buckets are compared.
+    Each hash may carry the source of its chunk, so a dropped duplicate can
+    tell which source its kept copy belongs to.
+    """
+    def __init__(self, max_distance: int = 6):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_bits = 64 // self.bands
+        self.buckets: Dict[Tuple[int, int], Set[str]] = defaultdict(set)
+        self.hashes: Dict[str, int] = {}
+        self.sources: Dict[str, Optional[str]] = {}
+
+    def _band_keys(self, value: int) -> List[Tuple[int, int]]:
+        mask = (1 << self.band_bits) - 1
+        return [(band, value >> (band * self.band_bits) & mask) for band in range(self.bands)]
+
+    def find(self, value: int, exclude: Optional[str] = None) -> Optional[str]:
+        for key in self._band_keys(value):
+            for cid in self.buckets.get(key, ()):
+                if cid != exclude and bin(self.hashes[cid] ^ value).count("1") <= self.max_distance:
+                    return cid
+        return None
+
+    def add(self, cid: str, value: int, source: Optional[str] = None):
+        self.remove(cid)
+        self.hashes[cid] = value
+        self.sources[cid] = source
+        for key in self._band_keys(value):
+            self.buckets[key].add(cid)
+
+    def remove(self, cid: str):
+        value = self.hashes.pop(cid, None)
+        if value is None:
+            return
+        del self.sources[cid]
+        for key in self._band_keys(value):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(cid)
+                if not bucket:
+                    del self.buckets[key]
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import functools
+from typing import Any, Dict, List, Tuple
+from .chunking import count_tokens
+from .metrics import metrics
+from .scheduler import Priority
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Role and separator tokens the chat format adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_MAX_WORDS = 150
+
+@functools.lru_cache(maxsize=4096)
+def content_tokens(content: str) -> int:
+    # History is re-sent on every turn, so each message is only tokenized once
+    return count_tokens(content)
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    return content_tokens(message['content']) + MESSAGE_OVERHEAD_TOKENS
+
+def fit_history(messages: List[Dict[str, Any]], budget: int) -> Tuple[List[Dict[str, str]], List[Dict[str, Any]]]:
+    """
+    Pick turns from newest to oldest until the token budget is spent. The newest
+    turn is always kept. Returns the kept turns as plain role/content messages in
+    chronological order, and the older turns that did not fit.
+    """
+    kept = []
+    used = 0
+    for index in range(len(messages) - 1, -1, -1):
+        tokens = message_tokens(messages[index])
+        if kept and used + tokens > budget:
+            return kept[::-1], messages[:index + 1]
+        kept.append({"role": messages[index]['role'], "content": messages[index]['content']})
+        used += tokens
+    return kept[::-1], []
+
+class ConversationSummarizer:
+    """
+    Keeps a running summary per channel of the turns that no longer fit the
+    prompt. The summary is only extended with turns newer than the ones it
+    already covers, and updates run in the background so replies never wait.
+    """
+    def __init__(self):
+        self.summaries: Dict[int, Dict[str, Any]] = {}  # Channel ID: {"text", "until" timestamp}
+        self.pending: Dict[int, List[Dict[str, Any]]] = {}
+        # Newest turn already queued or being summarized, per channel
+        self.taken_until: Dict[int, float] = {}
+        self.tasks: Dict[int, asyncio.Task] = {}
+
+    def get(self, channel_id: int) -> str:
+        return self.summaries.get(channel_id, {}).get("text", "")
+
+    def clear(self, channel_id: int):
+        # A running update would otherwise store a summary of the cleared turns afterwards
+        task = self.tasks.pop(channel_id, None)
+        if task is not None:
+            task.cancel()
+        self.summaries.pop(channel_id, None)
+        self.pending.pop(channel_id, None)
+        self.taken_until.pop(channel_id, None)
+
+    def update(self, bot, channel_id: int, turns: List[Dict[str, Any]]):
+        """Queue the turns the summary does not cover yet and fold them in the background."""
+        pending = self.pending.setdefault(channel_id, [])
+        seen = self.taken_until.get(channel_id, 0.0)
+        pending.extend(turn for turn in turns if turn['timestamp'] > seen)
+        if not pending:
+            del self.pending[channel_id]
+            return
+        # Advanced when turns are queued rather than summarized, so turns being summarized are not queued again
+        self.taken_until[channel_id] = pending[-1]['timestamp']
+        if channel_id not in self.tasks:
+            task = asyncio.create_task(self.run(bot, channel_id))
+            self.tasks[channel_id] = task
+            task.add_done_callback(lambda done: self.finished(channel_id, done))
+
+    def finished(self, channel_id: int, task: asyncio.Task):
+        # A cleared channel may already have started a new update
+        if self.tasks.get(channel_id) is task:
+            del self.tasks[channel_id]
+
+    async def run(self, bot, channel_id: int):
+        # Turns queued while a summary is being written are folded in by the next pass
+        while self.pending.get(channel_id):
+            turns = self.pending.pop(channel_id)
+            if not await self.summarize(bot, channel_id, turns):
+                # Retried with the next update instead of straight away
+                self.pending[channel_id] = turns + self.pending.get(channel_id, [])
+                return
+
+    async def summarize(self, bot, channel_id: int, turns: List[Dict[str, Any]]) -> bool:
+        # Imported here because llm_utils builds its prompts with this module
+        from .llm_utils import prepare_completion, rate_limited_completion
+        previous = self.get(channel_id)
+        transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+        prompt = (
+            f"Current summary of the conversation:\n{previous or '(none)'}\n\n"
+            f"New messages:\n{transcript}\n\n"
+            f"Update the summary so it also covers the new messages. Keep names, facts, decisions "
+            f"and open questions, and use at most {SUMMARY_MAX_WORDS} words. Reply with the summary only."
+        )
+        try:
+            kwargs = await prepare_completion(bot, [{"role": "user", "content": prompt}], use_grounding=False)
+            response = await rate_limited_completion(bot, priority=Priority.BACKGROUND, **kwargs)
+        except Exception as e:
+            logger.error(f"Error summarizing conversation history: {e}", exc_info=True)
+            return False
+        self.summaries[channel_id] = {
+            "text": response.choices[0].message.content.strip(),
+            "until": turns[-1]['timestamp'],
+        }
+        metrics.increment("context.summary_updates")
+        logger.info(f"Folded {len(turns)} turns into the conversation summary of channel {channel_id}")
+        return True
+
+summarizer = ConversationSummarizer()
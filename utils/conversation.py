@@ -0,0 +1,184 @@
+import os
+import time
+import asyncio
+import sqlite3
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class Turn:
+    """One message of a conversation. Indexing by key lets turns stand in for message dicts."""
+    __slots__ = ("role", "content", "timestamp")
+
+    def __init__(self, role: str, content: str, timestamp: float):
+        self.role = role
+        self.content = content
+        self.timestamp = timestamp
+
+    def __getitem__(self, key: str) -> Any:
+        return getattr(self, key)
+
+class ConversationStore:
+    """
+    Conversation history per channel, capped at max_messages turns each.
+    Only the max_channels most recently used channels stay in memory, and
+    channels idle for longer than ttl seconds are forgotten. With a db_path,
+    turns are written to SQLite in the background every flush_interval
+    seconds and channels are loaded back from it on first use.
+    """
+    def __init__(self, max_messages: int, max_channels: int, ttl: float,
+                 db_path: Optional[str] = None, flush_interval: float = 5.0,
+                 on_evict: Optional[Callable[[int], None]] = None):
+        self.max_messages = max_messages
+        self.max_channels = max_channels
+        self.ttl = ttl
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.on_evict = on_evict
+        self.channels: "OrderedDict[int, List[Turn]]" = OrderedDict()
+        self.last_used: Dict[int, float] = {}
+        self.pending_turns: List[Tuple[int, Turn]] = []
+        self.pending_clears: List[int] = []
+        self.flush_task: Optional[asyncio.Task] = None
+        self.db: Optional[sqlite3.Connection] = None
+        # A single thread owns the SQLite connection, so writes never block the event loop
+        self.executor = ThreadPoolExecutor(max_workers=1) if db_path else None
+
+    async def get(self, channel_id: int) -> List[Turn]:
+        """The channel's turns, oldest first. The list is live: use append to add turns."""
+        turns = self.channels.get(channel_id)
+        if turns is not None and time.time() - self.last_used[channel_id] > self.ttl:
+            self.evict(channel_id)
+            turns = None
+        if turns is None:
+            # A cleared channel's rows stay in the database until the next flush
+            cleared = channel_id in self.pending_clears
+            turns = await self.load(channel_id) if self.db_path and not cleared else []
+            # Turns not written yet are missing from the database
+            turns += [turn for cid, turn in self.pending_turns if cid == channel_id]
+            del turns[:-self.max_messages]
+            # Another message may have loaded the channel while this one waited
+            turns = self.channels.setdefault(channel_id, turns)
+            while len(self.channels) > self.max_channels:
+                self.evict(next(iter(self.channels)))
+        self.channels.move_to_end(channel_id)
+        self.last_used[channel_id] = time.time()
+        return turns
+
+    async def append(self, channel_id: int, role: str, content: str) -> List[Turn]:
+        """Add a turn to the channel. Returns the turns trimmed to stay within max_messages."""
+        turns = await self.get(channel_id)
+        turn = Turn(role, content, time.time())
+        turns.append(turn)
+        trimmed = turns[:-self.max_messages]
+        del turns[:-self.max_messages]
+        if self.db_path:
+            self.pending_turns.append((channel_id, turn))
+            self.schedule_flush()
+        return trimmed
+
+    async def clear(self, channel_id: int) -> bool:
+        """Forget the channel's history. Returns whether there was any."""
+        existed = bool(await self.get(channel_id))
+        self.evict(channel_id)
+        if self.db_path:
+            self.pending_turns = [(cid, turn) for cid, turn in self.pending_turns if cid != channel_id]
+            self.pending_clears.append(channel_id)
+            self.schedule_flush()
+        # Kept as an empty history so the next message does not read the old turns back
+        self.channels[channel_id] = []
+        self.last_used[channel_id] = time.time()
+        return existed
+
+    def evict(self, channel_id: int):
+        self.channels.pop(channel_id, None)
+        self.last_used.pop(channel_id, None)
+        if self.on_evict is not None:
+            self.on_evict(channel_id)
+
+    def __len__(self) -> int:
+        return len(self.channels)
+
+    def schedule_flush(self):
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self.flush_later())
+
+    async def flush_later(self):
+        # Messages arriving within the interval are written in one transaction
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        if not self.db_path or not (self.pending_turns or self.pending_clears):
+            return
+        turns, self.pending_turns = self.pending_turns, []
+        clears, self.pending_clears = self.pending_clears, []
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.write, turns, clears)
+        except Exception as e:
+            logger.error(f"Error writing conversation history to {self.db_path}: {e}", exc_info=True)
+
+    async def close(self):
+        """Write pending turns and close the database."""
+        if self.flush_task is not None and not self.flush_task.done():
+            self.flush_task.cancel()
+        await self.flush()
+        if self.executor is not None:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.close_db)
+            self.executor.shutdown()
+
+    async def load(self, channel_id: int) -> List[Turn]:
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, self.read, channel_id)
+        except Exception as e:
+            logger.error(f"Error reading conversation history from {self.db_path}: {e}", exc_info=True)
+            return []
+
+    # The methods below run on the store's database thread
+
+    def connect(self) -> sqlite3.Connection:
+        if self.db is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS turns ("
+                "channel_id INTEGER NOT NULL, timestamp REAL NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS turns_channel ON turns (channel_id, timestamp)")
+        return self.db
+
+    def read(self, channel_id: int) -> List[Turn]:
+        rows = self.connect().execute(
+            "SELECT role, content, timestamp FROM turns WHERE channel_id = ? AND timestamp > ? "
+            "ORDER BY timestamp DESC LIMIT ?",
+            (channel_id, time.time() - self.ttl, self.max_messages),
+        ).fetchall()
+        return [Turn(role, content, timestamp) for role, content, timestamp in reversed(rows)]
+
+    def write(self, turns: List[Tuple[int, Turn]], clears: List[int]):
+        db = self.connect()
+        with db:
+            db.executemany("DELETE FROM turns WHERE channel_id = ?", [(cid,) for cid in clears])
+            db.executemany(
+                "INSERT INTO turns (channel_id, timestamp, role, content) VALUES (?, ?, ?, ?)",
+                [(cid, turn.timestamp, turn.role, turn.content) for cid, turn in turns],
+            )
+            # Keep only what a reload could use: the newest turns of each channel, within the TTL
+            db.executemany(
+                "DELETE FROM turns WHERE channel_id = ? AND timestamp < ("
+                "SELECT MIN(timestamp) FROM (SELECT timestamp FROM turns WHERE channel_id = ? "
+                "ORDER BY timestamp DESC LIMIT ?))",
+                [(cid, cid, self.max_messages) for cid in {cid for cid, _ in turns}],
+            )
+            db.execute("DELETE FROM turns WHERE timestamp < ?", (time.time() - self.ttl,))
+
+    def close_db(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
@@ -0,0 +1,76 @@
+import io
+import time
+import codecs
+from typing import Optional, Tuple
+
+# Worker-side helpers for the grounding parse pool. They run in separate
+# processes, so this module only depends on the standard library and the
+# document parsers themselves.
+
+BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+SNIFF_SIZE = 8192
+# Printable ASCII, common whitespace and every byte >= 0x80
+TEXT_BYTES = bytes({7, 8, 9, 10, 12, 13, 27} | set(range(0x20, 0x7f)) | set(range(0x80, 0x100)))
+BINARY_THRESHOLD = 0.05
+
+def sniff_encoding(data: bytes) -> Optional[str]:
+    """
+    Pick a text encoding from the raw bytes, or return None for binary data.
+    A BOM wins; otherwise NUL bytes mean binary, valid UTF-8 means UTF-8 and
+    anything else falls back to Latin-1, unless control bytes make it look binary.
+    """
+    for bom, encoding in BOMS:
+        if data.startswith(bom):
+            return encoding
+    sample = data[:SNIFF_SIZE]
+    if b'\x00' in sample:
+        return None
+    try:
+        data.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    if sample and len(sample.translate(None, TEXT_BYTES)) / len(sample) > BINARY_THRESHOLD:
+        return None
+    return 'latin-1'
+
+def read_docx(file) -> str:
+    from docx import Document
+    doc = Document(file)
+    return "\n".join([paragraph.text for paragraph in doc.paragraphs])
+
+def read_pdf(file) -> str:
+    from pypdf import PdfReader
+    reader = PdfReader(file)
+    return "\n".join(page.extract_text() or "" for page in reader.pages)
+
+def parse_document(name: str, data: bytes) -> Optional[str]:
+    """Extract the text of a grounding file. Returns None for unsupported binary files."""
+    lower_name = name.lower()
+    if lower_name.endswith('.pdf'):
+        return read_pdf(io.BytesIO(data))
+    if lower_name.endswith('.docx'):
+        return read_docx(io.BytesIO(data))
+    encoding = sniff_encoding(data)
+    if encoding is None:
+        return None
+    return data.decode(encoding)
+
+def parse_grounding_file(name: str, data: Optional[bytes] = None,
+                         path: Optional[str] = None) -> Tuple[Optional[str], float]:
+    """
+    Parse a grounding file in a worker process, reading it from path when no
+    data is given. Returns the extracted text and the time spent in seconds.
+    """
+    start_time = time.perf_counter()
+    if data is None:
+        with open(path, 'rb') as file:
+            data = file.read()
+    content = parse_document(name, data)
+    return content, time.perf_counter() - start_time
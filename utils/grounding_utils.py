@@ -1,119 +1,349 @@
 import os
-import boto3
-from azure.storage.blob import BlobServiceClient
-from config import Config
-from docx import Document
-from .rag_utils import initialize_rag
+import json
+import time
+import asyncio
+import hashlib
 import logging
-import os
-from typing import List, Dict, Optional
-from .rag_utils import initialize_rag
+import functools
+import itertools
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+from .document_parsing import parse_grounding_file
+from .metrics import metrics
+from .rag_utils import rag_system, update_rag
+from .response_cache import response_cache
 from config import Config
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def load_grounding_data() -> List[Dict[str, str]]:
+MANIFEST_FILENAME = "grounding_manifest.json"
+SUPPORTED_REMOTE_EXTENSIONS = ('.txt', '.pdf', '.docx')
+
+def load_grounding_data() -> Dict[str, Any]:
+    """
+    Sync the RAG index with the configured grounding source.
+    Only files whose size, mtime/ETag or content changed since the last
+    load are fetched and re-indexed, and deleted files are dropped.
+    Returns a report with the added, changed and removed file names.
+    """
+    report = {"added": [], "changed": [], "removed": [], "unchanged": 0, "total": 0, "elapsed": 0.0}
     if not Config.USE_GROUNDING:
         logger.info("Grounding is disabled")
-        return []
+        return report
 
+    start_time = time.time()
     logger.info(f"Loading grounding data from source: {Config.GROUNDING_SOURCE}")
-    grounding_data = []
     if Config.GROUNDING_SOURCE == "local":
-        grounding_data = load_local_grounding_data()
+        # Local files are read by the parse workers themselves
+        list_objects, fetch_object = list_local_grounding_files, None
     elif Config.GROUNDING_SOURCE == "s3":
-        grounding_data = load_s3_grounding_data()
+        list_objects, fetch_object = list_s3_grounding_objects, fetch_s3_grounding_object
     elif Config.GROUNDING_SOURCE == "azure":
-        grounding_data = load_azure_grounding_data()
+        list_objects, fetch_object = list_azure_grounding_blobs, fetch_azure_grounding_blob
     else:
         logger.error(f"Unknown grounding source: {Config.GROUNDING_SOURCE}")
-    
-    logger.info(f"Loaded {len(grounding_data)} grounding documents")
-    
-    if grounding_data:
-        logger.info("Initializing RAG system with grounding data")
-        initialize_rag(grounding_data)
+        return report
+
+    manifest = load_manifest()
+    previous = manifest.get("files", {})
+    if manifest.get("source") != grounding_source_key() or rag_system.chunk_count() == 0:
+        # The index no longer matches the manifest, so everything has to be loaded again
+        previous = {}
+
+    current = {entry["path"]: entry for entry in list_objects()}
+    files = {}
+    to_fetch = []
+    for path, entry in current.items():
+        old = previous.get(path)
+        if old and old["size"] == entry["size"] and old["version"] == entry["version"]:
+            files[path] = old
+            report["unchanged"] += 1
+        else:
+            to_fetch.append(entry)
+    if previous:
+        report["removed"] = [path for path in previous if path not in current]
     else:
-        logger.warning("No grounding data found. RAG system will not be initialized.")
-    
-    return grounding_data
-
-def load_local_grounding_data() -> List[Dict[str, str]]:
-    grounding_data = []
-    for filename in os.listdir(Config.GROUNDING_PATH):
-        file_path = os.path.join(Config.GROUNDING_PATH, filename)
-        if os.path.isfile(file_path):
-            content = read_file_with_fallback_encoding(file_path)
-            if content is not None:
-                grounding_data.append({"filename": filename, "content": content})
-    return grounding_data
-
-def read_file_with_fallback_encoding(file_path: str) -> Optional[str]:
-    encodings = ['utf-8', 'latin-1', 'ascii']
-    for encoding in encodings:
+        # Without a usable manifest the indexes themselves tell what an earlier source left behind
+        report["removed"] = sorted(rag_system.sources() - current.keys())
+
+    def changed_documents(entries: List[Dict[str, Any]], reindex: bool = False):
+        # Documents are yielded as soon as they are parsed, so chunking and
+        # embedding overlap with the remaining downloads and parsing
+        for entry, content in parse_concurrently(parse_jobs(fetch_object, entries)):
+            path = entry["path"]
+            old = previous.get(path)
+            if content is None:
+                # Remember unsupported files so they are not parsed again on every reload
+                files[path] = {"size": entry["size"], "version": entry["version"], "content_hash": None}
+                if old and old["content_hash"] is not None:
+                    # An empty document drops the chunks indexed from the previous version
+                    if not reindex:
+                        report["changed"].append(path)
+                    yield {"filename": path, "content": ""}
+                continue
+            content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+            files[path] = {"size": entry["size"], "version": entry["version"], "content_hash": content_hash}
+            if not reindex:
+                if old and old["content_hash"] == content_hash:
+                    report["unchanged"] += 1
+                    continue
+                report["changed" if old else "added"].append(path)
+            yield {"filename": path, "content": content}
+
+    def record_duplicates(duplicate_of: Dict[str, Set[str]]):
+        for path, sources in duplicate_of.items():
+            if path not in files:
+                continue
+            if sources:
+                files[path]["duplicate_of"] = sorted(sources)
+            else:
+                files[path].pop("duplicate_of", None)
+
+    logger.info(f"Fetching {len(to_fetch)} new or modified grounding files")
+    record_duplicates(update_rag(changed_documents(to_fetch), report["removed"]))
+    for entry in to_fetch:
+        if entry["path"] not in files and entry["path"] in previous:
+            # Fetching or parsing failed: keep serving the indexed version and retry next reload
+            files[entry["path"]] = previous[entry["path"]]
+
+    # Chunks skipped as near-duplicates are only in the index through the file that kept them,
+    # so files depending on a changed or removed file are indexed again
+    affected = set(report["changed"]) | set(report["removed"])
+    dependents = [current[path] for path, file in files.items()
+                  if path not in affected and affected & set(file.get("duplicate_of", ()))]
+    if dependents:
+        logger.info(f"Re-indexing {len(dependents)} files that share near-duplicate chunks with changed files")
+        stale = {entry["path"]: files[entry["path"]] for entry in dependents}
+        record_duplicates(update_rag(changed_documents(dependents, reindex=True)))
+        for path, file in stale.items():
+            if files[path] is file:
+                # Not indexed again: forgetting the file makes the next reload fetch it as new
+                del files[path]
+    if report["added"] or report["changed"] or report["removed"]:
+        # Cached answers may quote grounding that no longer exists
+        response_cache.clear()
+    save_manifest({"source": grounding_source_key(), "files": files})
+
+    report["total"] = sum(1 for file in files.values() if file["content_hash"] is not None)
+    report["elapsed"] = time.time() - start_time
+    logger.info(f"Grounding changes: {len(report['added'])} added, {len(report['changed'])} changed, "
+                f"{len(report['removed'])} removed, {report['unchanged']} unchanged")
+    logger.info(f"Loaded {report['total']} grounding documents in {report['elapsed']:.2f} seconds")
+    return report
+
+class GroundingLoader:
+    """
+    Runs grounding loads on a worker thread, one at a time, so indexing never
+    blocks the event loop. At startup the persisted indexes are opened first and
+    then synced with the source in the background; until an index is available
+    the bot is warming up and answers without grounding.
+    """
+    def __init__(self):
+        self._lock = None
+        self.warmup_task: Optional[asyncio.Task] = None
+        self.warm = False
+        self.notified_channels: Set[int] = set()
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        # Created lazily so the lock binds to the bot's running event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    @property
+    def warming_up(self) -> bool:
+        return Config.USE_GROUNDING and not self.warm
+
+    def first_notice(self, channel_id: int) -> bool:
+        """True the first time a channel is told that grounding is still warming up."""
+        if channel_id in self.notified_channels:
+            return False
+        self.notified_channels.add(channel_id)
+        return True
+
+    def start_warmup(self):
+        if self.warmup_task is None:
+            self.warmup_task = asyncio.ensure_future(self.warm_up())
+
+    async def warm_up(self):
+        start_time = time.time()
         try:
-            with open(file_path, 'r', encoding=encoding) as file:
-                return file.read()
-        except UnicodeDecodeError:
-            logger.warning(f"Failed to decode {file_path} with {encoding} encoding. Trying next encoding.")
+            async with self.lock:
+                # Indexes persisted by the previous run can answer while the source is synced
+                await asyncio.get_running_loop().run_in_executor(None, rag_system.activate)
+            if rag_system.ready:
+                self.warm = True
+                logger.info(f"Grounding index opened in {time.time() - start_time:.2f} seconds, syncing with the source")
+            report = await self.load()
+            logger.info(f"Grounding data loaded: {report['total']} files in {report['elapsed']:.2f} seconds")
+            for filename in report['added'] + report['changed']:
+                logger.info(f"Indexed: {filename}")
+            for filename in report['removed']:
+                logger.info(f"Removed: {filename}")
         except Exception as e:
-            logger.error(f"Error reading file {file_path}: {str(e)}")
-            return None
-    
-    logger.error(f"Failed to read {file_path} with all attempted encodings.")
-    return None
+            logger.error(f"Error warming up grounding data: {e}", exc_info=True)
+        finally:
+            self.warm = True
+            self.notified_channels.clear()
+            metrics.set_gauge("grounding.warmup_seconds", round(time.time() - start_time, 2))
 
+    async def load(self) -> Dict[str, Any]:
+        """Run load_grounding_data off the event loop, after any load already running."""
+        async with self.lock:
+            return await asyncio.get_running_loop().run_in_executor(None, load_grounding_data)
 
-__all__ = ['load_grounding_data']
+grounding_loader = GroundingLoader()
 
-def read_docx(file_path):
-    doc = Document(file_path)
-    return "\n".join([paragraph.text for paragraph in doc.paragraphs])
+def fetch_concurrently(fetch_object: Callable[[Dict[str, Any]], bytes],
+                       entries: List[Dict[str, Any]]) -> Iterator[Tuple[Dict[str, Any], Optional[bytes]]]:
+    """Fetch entries on a bounded thread pool, yielding each one as soon as it completes."""
+    if not entries:
+        return
+    remaining = iter(entries)
+    with ThreadPoolExecutor(max_workers=Config.GROUNDING_DOWNLOAD_CONCURRENCY) as executor:
+        # Only a small window of downloads is in flight, so memory stays flat
+        # when chunking and embedding are slower than the network
+        pending = {
+            executor.submit(fetch_object, entry): entry
+            for entry in itertools.islice(remaining, Config.GROUNDING_DOWNLOAD_CONCURRENCY * 2)
+        }
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                entry = pending.pop(future)
+                next_entry = next(remaining, None)
+                if next_entry is not None:
+                    pending[executor.submit(fetch_object, next_entry)] = next_entry
+                try:
+                    data = future.result()
+                except Exception as e:
+                    logger.error(f"Error fetching grounding file {entry['path']}: {e}")
+                    data = None
+                yield entry, data
 
-def load_s3_grounding_data():
-    s3 = boto3.client(
+def parse_jobs(fetch_object: Optional[Callable[[Dict[str, Any]], bytes]],
+               entries: List[Dict[str, Any]]) -> Iterator[Tuple[Dict[str, Any], tuple]]:
+    """Yield (entry, parse_grounding_file arguments) for every file that has to be parsed."""
+    if fetch_object is None:
+        for entry in entries:
+            yield entry, (entry["path"], None, os.path.join(Config.GROUNDING_PATH, entry["path"]))
+        return
+    for entry, data in fetch_concurrently(fetch_object, entries):
+        if data is not None:
+            yield entry, (entry["path"], data, None)
+
+def parse_concurrently(jobs: Iterator[Tuple[Dict[str, Any], tuple]]) -> Iterator[Tuple[Dict[str, Any], Optional[str]]]:
+    """Parse files on a process pool, yielding each entry with its text as soon as it is ready."""
+    window = Config.GROUNDING_PARSE_WORKERS * 2
+    # Forking would copy the bot's event loop, executor threads and their held locks into the
+    # workers; they only need the parsing module, so they start clean instead
+    start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    with ProcessPoolExecutor(max_workers=Config.GROUNDING_PARSE_WORKERS,
+                             mp_context=multiprocessing.get_context(start_method)) as executor:
+        pending = {}
+
+        def completed(block: bool):
+            done, _ = wait(pending, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+            for future in done:
+                entry = pending.pop(future)
+                try:
+                    content, elapsed = future.result()
+                except Exception as e:
+                    logger.error(f"Error parsing grounding file {entry['path']}: {e}")
+                    continue
+                if content is None:
+                    logger.warning(f"Skipped {entry['path']}: unsupported binary file")
+                else:
+                    logger.info(f"Parsed {entry['path']} in {elapsed * 1000:.1f} ms")
+                yield entry, content
+
+        for entry, args in jobs:
+            pending[executor.submit(parse_grounding_file, *args)] = entry
+            # Stop pulling new jobs while the pool is saturated
+            yield from completed(block=len(pending) >= window)
+        while pending:
+            yield from completed(block=True)
+
+def grounding_source_key() -> str:
+    if Config.GROUNDING_SOURCE == "local":
+        return f"local:{os.path.abspath(Config.GROUNDING_PATH)}"
+    if Config.GROUNDING_SOURCE == "s3":
+        return f"s3:{Config.AWS_BUCKET_NAME}"
+    return f"azure:{Config.AZURE_CONTAINER_NAME}"
+
+def manifest_path() -> str:
+    # Kept next to the vector index so the two are always deleted or copied together
+    return os.path.join(Config.CHROMA_PERSIST_DIR, MANIFEST_FILENAME)
+
+def load_manifest() -> Dict[str, Any]:
+    try:
+        with open(manifest_path(), 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable grounding manifest: {e}")
+        return {}
+
+def save_manifest(manifest: Dict[str, Any]):
+    os.makedirs(os.path.dirname(manifest_path()), exist_ok=True)
+    temp_path = manifest_path() + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file)
+    os.replace(temp_path, manifest_path())
+
+def list_local_grounding_files() -> List[Dict[str, Any]]:
+    entries = []
+    for entry in os.scandir(Config.GROUNDING_PATH):
+        if entry.is_file():
+            stat = entry.stat()
+            entries.append({"path": entry.name, "size": stat.st_size, "version": str(stat.st_mtime_ns)})
+    return entries
+
+@functools.lru_cache(maxsize=None)
+def get_s3_client():
+    # Cloud SDKs are only imported for the configured grounding source
+    import boto3
+    from botocore.config import Config as BotoConfig
+    # boto3 clients are thread-safe; one client with a connection pool sized
+    # to the download concurrency is shared by all fetches
+    return boto3.client(
         's3',
         aws_access_key_id=Config.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=Config.AWS_SECRET_ACCESS_KEY
+        aws_secret_access_key=Config.AWS_SECRET_ACCESS_KEY,
+        config=BotoConfig(max_pool_connections=Config.GROUNDING_DOWNLOAD_CONCURRENCY)
     )
-    grounding_data = []
-    
-    response = s3.list_objects_v2(Bucket=Config.AWS_BUCKET_NAME)
-    for obj in response.get('Contents', []):
-        if obj['Key'].endswith(('.txt', '.docx')):
-            file_content = s3.get_object(Bucket=Config.AWS_BUCKET_NAME, Key=obj['Key'])['Body'].read()
-            if obj['Key'].endswith('.txt'):
-                content = file_content.decode('utf-8')
-            elif obj['Key'].endswith('.docx'):
-                with open('temp.docx', 'wb') as temp_file:
-                    temp_file.write(file_content)
-                content = read_docx('temp.docx')
-                os.remove('temp.docx')
-            grounding_data.append({"filename": obj['Key'], "content": content})
-    
-    return grounding_data
-
-def load_azure_grounding_data():
+
+def list_s3_grounding_objects() -> List[Dict[str, Any]]:
+    paginator = get_s3_client().get_paginator('list_objects_v2')
+    return [
+        {"path": obj['Key'], "size": obj['Size'], "version": obj['ETag']}
+        for page in paginator.paginate(Bucket=Config.AWS_BUCKET_NAME)
+        for obj in page.get('Contents', [])
+        if obj['Key'].lower().endswith(SUPPORTED_REMOTE_EXTENSIONS)
+    ]
+
+def fetch_s3_grounding_object(entry: Dict[str, Any]) -> bytes:
+    return get_s3_client().get_object(Bucket=Config.AWS_BUCKET_NAME, Key=entry["path"])['Body'].read()
+
+@functools.lru_cache(maxsize=None)
+def get_azure_container_client():
+    from azure.storage.blob import BlobServiceClient
     blob_service_client = BlobServiceClient.from_connection_string(Config.AZURE_STORAGE_CONNECTION_STRING)
-    container_client = blob_service_client.get_container_client(Config.AZURE_CONTAINER_NAME)
-    
-    grounding_data = []
-    blob_list = container_client.list_blobs()
-    for blob in blob_list:
-        if blob.name.endswith(('.txt', '.docx')):
-            blob_client = container_client.get_blob_client(blob.name)
-            file_content = blob_client.download_blob().readall()
-            if blob.name.endswith('.txt'):
-                content = file_content.decode('utf-8')
-            elif blob.name.endswith('.docx'):
-                with open('temp.docx', 'wb') as temp_file:
-                    temp_file.write(file_content)
-                content = read_docx('temp.docx')
-                os.remove('temp.docx')
-            grounding_data.append({"filename": blob.name, "content": content})
-    
-    return grounding_data
-
-__all__ = ['load_grounding_data']
\ No newline at end of file
+    return blob_service_client.get_container_client(Config.AZURE_CONTAINER_NAME)
+
+def list_azure_grounding_blobs() -> List[Dict[str, Any]]:
+    return [
+        {"path": blob.name, "size": blob.size, "version": blob.etag}
+        for blob in get_azure_container_client().list_blobs()
+        if blob.name.lower().endswith(SUPPORTED_REMOTE_EXTENSIONS)
+    ]
+
+def fetch_azure_grounding_blob(entry: Dict[str, Any]) -> bytes:
+    return get_azure_container_client().get_blob_client(entry["path"]).download_blob().readall()
+
+__all__ = ['load_grounding_data', 'grounding_loader']
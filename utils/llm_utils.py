@@ -1,131 +1,308 @@
 import time
-import asyncio
 import logging
-from typing import List, Dict, Any
-import discord
-from litellm import acompletion
-from .rag_utils import rag_query
+from typing import List, Dict, Any, AsyncIterator, Callable, Optional
+from .context import fit_history, message_tokens, summarizer
+from .grounding_utils import grounding_loader
+from .metrics import metrics
+from .rag_utils import rag_query, rag_system
+from .response_cache import CacheLookup, ResponseCache, response_cache
+from .scheduler import Priority
+from .singleflight import SingleFlight, request_key
 from config import Config
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-async def generate_response(bot, messages: List[Dict[str, Any]]) -> str:
-    """Generate a response using the configured LLM and RAG if available."""
-    try:
-        last_message = messages[-1]['content']
-        logger.info(f"Generating response for message: {last_message[:50]}...")  # Log first 50 chars of the message
-        
+completion_flight = SingleFlight("completion")
+
+# Completion size assumed for the provider token budget when LLM_SETTINGS sets no max_tokens
+DEFAULT_COMPLETION_TOKENS = 512
+
+async def prepare_completion(bot, messages: List[Dict[str, Any]], use_grounding: bool = True,
+                             channel_id: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Build the acompletion arguments: grounded system message, history and provider settings.
+    The history is cut to CONTEXT_TOKEN_BUDGET from the newest turn back; with a channel_id,
+    the turns left out are covered by that channel's running summary instead.
+    """
+    last_message = messages[-1]['content']
+    logger.info(f"Generating response for message: {last_message[:50]}...")  # Log first 50 chars of the message
+
+    rag_response = ""
+    if use_grounding and bot.config.USE_GROUNDING and not rag_system.ready:
+        # Still warming up or nothing indexed: answer without grounding rather than wait
+        metrics.increment("rag.not_ready")
+    elif use_grounding and bot.config.USE_GROUNDING:
         logger.info("Querying RAG system")
         rag_response = await rag_query(last_message)
         logger.info(f"RAG query completed. Response length: {len(rag_response)} characters")
-        
-        system_message = f"{bot.config.SYSTEM_PROMPT}\n\nRelevant Information: {rag_response}"
-        
-        kwargs = {
-            "model": bot.config.LLM_MODEL,
-            "messages": [{"role": "system", "content": system_message}] + messages,
-            **bot.config.LLM_SETTINGS
-        }
-
-        if bot.config.LLM_TYPE == "openai":
-            kwargs["api_key"] = bot.config.OPENAI_API_KEY
-        elif bot.config.LLM_TYPE == "anthropic":
-            kwargs["api_key"] = bot.config.ANTHROPIC_API_KEY
-        elif bot.config.LLM_TYPE == "local":
-            kwargs["api_base"] = bot.config.LOCAL_LLM_URL
-
-        logger.info(f"Sending request to LLM: {bot.config.LLM_TYPE}")
-        logger.debug(f"LLM request details: model={bot.config.LLM_MODEL}, message_count={len(messages)}")
-        
-        response = await rate_limited_completion(bot, **kwargs)
+    else:
+        metrics.increment("rag.bypassed")
+
+    system_message = bot.config.SYSTEM_PROMPT
+    if rag_response:
+        system_message += f"\n\nRelevant Information (mention the source when you use it):\n{rag_response}"
+    summary = summarizer.get(channel_id) if channel_id is not None else ""
+    if summary:
+        system_message += f"\n\nSummary of the earlier conversation:\n{summary}"
+
+    system_tokens = message_tokens({"content": system_message})
+    history, older = fit_history(messages, bot.config.CONTEXT_TOKEN_BUDGET - system_tokens)
+    prompt_tokens = system_tokens + sum(message_tokens(turn) for turn in history)
+    logger.info(f"Prompt size: {prompt_tokens} tokens ({system_tokens} system, "
+                f"{len(history)} of {len(messages)} turns)")
+    metrics.observe("llm.prompt_tokens", prompt_tokens)
+    if older:
+        metrics.increment("context.turns_dropped", len(older))
+        if channel_id is not None and bot.config.SUMMARIZE_HISTORY:
+            summarizer.update(bot, channel_id, older)
+
+    # The provider pool adds the model and credentials of whichever provider serves the request
+    kwargs = {
+        "messages": [{"role": "system", "content": system_message}] + history,
+        **bot.config.LLM_SETTINGS
+    }
+
+    logger.debug(f"LLM request details: providers={bot.config.LLM_PROVIDERS}, message_count={len(messages)}")
+    return kwargs
+
+async def generate_response(bot, messages: List[Dict[str, Any]], use_grounding: bool = True,
+                            channel_id: Optional[int] = None, user_id: Optional[int] = None,
+                            guild_id: Optional[int] = None, priority: Priority = Priority.COMMAND,
+                            use_cache: bool = True) -> str:
+    """
+    Generate a response using the configured LLM and RAG if available.
+    Callers whose prompts never benefit from grounding pass use_grounding=False,
+    and callers that want a fresh answer every time pass use_cache=False.
+    """
+    try:
+        lookup = await cache_lookup(bot, messages, use_grounding, channel_id) if use_cache else None
+        if lookup is not None and lookup.response is not None:
+            logger.info("Response served from the response cache")
+            return lookup.response
+
+        kwargs = await prepare_completion(bot, messages, use_grounding, channel_id)
+        response = await rate_limited_completion(bot, user_id=user_id, guild_id=guild_id,
+                                                 priority=priority, **kwargs)
         
         logger.info("LLM response received")
         logger.debug(f"LLM response details: length={len(response.choices[0].message.content)} characters")
         
-        return response.choices[0].message.content
+        content = response.choices[0].message.content
+        if lookup is not None and content:
+            response_cache.store(lookup, content)
+        return content
     except Exception as e:
         logger.error(f"Error in generate_response: {e}", exc_info=True)
         return "An unexpected error occurred. Please try again later."
 
-async def rate_limited_completion(bot, *args, **kwargs):
-    """Perform rate-limited completion requests to the LLM."""
-    current_time = time.time()
-    bot.request_timestamps.append(current_time)
-    
-    bot.request_timestamps = [ts for ts in bot.request_timestamps if current_time - ts < bot.config.REQUEST_WINDOW]
-    
-    if len(bot.request_timestamps) > bot.config.MAX_REQUESTS_PER_MINUTE:
-        wait_time = bot.config.REQUEST_WINDOW - (current_time - bot.request_timestamps[0])
-        logger.warning(f"Rate limit reached. Waiting for {wait_time:.2f} seconds before next request.")
-        await asyncio.sleep(wait_time)
+async def cache_lookup(bot, messages: List[Dict[str, Any]], use_grounding: bool,
+                       channel_id: Optional[int]) -> Optional[CacheLookup]:
+    """Look the prompt up in the response cache; None when caching is disabled."""
+    if not response_cache.enabled:
+        return None
+    scope = ResponseCache.scope(
+        model=bot.config.LLM_PROVIDERS,
+        settings=bot.config.LLM_SETTINGS,
+        system=bot.config.SYSTEM_PROMPT,
+        grounding=use_grounding and bot.config.USE_GROUNDING,
+        summary=summarizer.get(channel_id) if channel_id is not None else "",
+    )
+    return await response_cache.lookup(scope, messages, rag_system.embed_query if rag_system.use_vectors else None)
+
+async def stream_response(bot, messages: List[Dict[str, Any]], use_grounding: bool = True,
+                          channel_id: Optional[int] = None, user_id: Optional[int] = None,
+                          guild_id: Optional[int] = None,
+                          priority: Priority = Priority.INTERACTIVE) -> AsyncIterator[str]:
+    """Like generate_response, but yields the text in pieces as the LLM produces it."""
+    kwargs = await prepare_completion(bot, messages, use_grounding, channel_id)
+    response = await rate_limited_completion(bot, stream=True, user_id=user_id, guild_id=guild_id,
+                                             priority=priority, **kwargs)
+    async for chunk in response:
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
+
+async def rate_limited_completion(bot, user_id: Optional[int] = None, guild_id: Optional[int] = None,
+                                  priority: Priority = Priority.COMMAND, **kwargs):
+    """
+    Perform rate-limited completion requests to the LLM. The request waits for the
+    user's, guild's and global request buckets and for the provider's request and
+    token budgets; the token estimate is corrected from the reported usage.
+    It then waits for a scheduler slot, held until a streamed response is fully read.
+    Identical requests made at the same time share one completion; streams are never shared.
+    """
+    if kwargs.get("stream"):
+        return await send_completion(bot, user_id=user_id, guild_id=guild_id, priority=priority, **kwargs)
+    return await completion_flight.do(
+        request_key(kwargs),
+        lambda: send_completion(bot, user_id=user_id, guild_id=guild_id, priority=priority, **kwargs),
+    )
+
+async def send_completion(bot, user_id: Optional[int] = None, guild_id: Optional[int] = None,
+                          priority: Priority = Priority.COMMAND, **kwargs):
+    estimated_tokens = (sum(message_tokens(message) for message in kwargs.get("messages", []))
+                        + kwargs.get("max_tokens", DEFAULT_COMPLETION_TOKENS))
+    await bot.rate_limiter.acquire(user_id=user_id, guild_id=guild_id, tokens=estimated_tokens, priority=priority)
     
+    await bot.scheduler.acquire(priority, guild_id)
     logger.info("Sending rate-limited completion request to LLM")
     start_time = time.time()
+    released = False
     try:
-        response = await acompletion(*args, **kwargs)
+        response = await bot.providers.complete(estimated_tokens=estimated_tokens, **kwargs)
         end_time = time.time()
         logger.info(f"LLM request completed in {end_time - start_time:.2f} seconds")
+        if kwargs.get("stream"):
+            released = True
+            return release_after_stream(bot, response)
+        usage = getattr(response, "usage", None)
+        if usage is not None and getattr(usage, "total_tokens", None):
+            bot.rate_limiter.reconcile(estimated_tokens, usage.total_tokens)
         return response
     except Exception as e:
         logger.error(f"Error in LLM completion request: {e}", exc_info=True)
         raise
+    finally:
+        if not released:
+            bot.scheduler.release()
+
+async def release_after_stream(bot, response) -> AsyncIterator[Any]:
+    try:
+        async for chunk in response:
+            yield chunk
+    finally:
+        bot.scheduler.release()
 
 async def handle_chat_message(bot, message):
     """Handle incoming chat messages."""
     logger.info(f"Handling chat message from user {message.author.name} in channel {message.channel.name}")
     
-    async with message.channel.typing():
-        if message.channel.id not in bot.conversation_history:
-            bot.conversation_history[message.channel.id] = []
-        
-        bot.conversation_history[message.channel.id].append({
-            "role": "user",
-            "content": message.content,
-            "timestamp": time.time()
-        })
-        
-        if len(bot.conversation_history[message.channel.id]) > bot.config.MAX_MESSAGES:
-            logger.info(f"Trimming conversation history for channel {message.channel.name}")
-            bot.conversation_history[message.channel.id] = bot.conversation_history[message.channel.id][-bot.config.MAX_MESSAGES:]
-
-        logger.info("Generating response")
-        response = await generate_response(bot, bot.conversation_history[message.channel.id])
-        logger.info(f"Response generated. Length: {len(response)} characters")
-
-        # Truncate the response if it exceeds MAX_TEXT
-        if len(response) > bot.config.MAX_TEXT:
-            logger.warning(f"Response exceeds MAX_TEXT ({bot.config.MAX_TEXT}). Truncating.")
-            truncation_msg = "... (response truncated due to length)"
-            response = response[:bot.config.MAX_TEXT - len(truncation_msg)] + truncation_msg
-
-        bot.conversation_history[message.channel.id].append({
-            "role": "assistant",
-            "content": response,
-            "timestamp": time.time()
-        })
-
-        # Split the response into chunks of MAX_TEXT length
-        chunks = [response[i:i+bot.config.MAX_TEXT] for i in range(0, len(response), bot.config.MAX_TEXT)]
-        
-        logger.info(f"Sending response in {len(chunks)} chunk(s)")
-        for chunk in chunks:
-            await message.reply(chunk)
-
-        if message.guild and message.guild.voice_client and bot.tts_enabled:
-            logger.info("Generating TTS for response")
-            from .tts_utils import generate_tts, cleanup_tts_file
-            tts_file = await generate_tts(response)
-            if tts_file:
-                try:
-                    logger.info("Playing TTS audio")
-                    message.guild.voice_client.play(discord.FFmpegPCMAudio(tts_file))
-                    await cleanup_tts_file(message.guild.voice_client, tts_file)
-                except Exception as e:
-                    logger.error(f"Error playing TTS: {e}", exc_info=True)
-                    await message.channel.send("I encountered an error while trying to play the audio response.")
+    speech = None
+    if message.guild and message.guild.voice_client and bot.tts_enabled:
+        # Sentences are spoken as soon as they are generated, while the rest of the reply is still being written
+        speech = bot.voice_players.speak(message.guild.id, message.guild.voice_client)
+
+    if grounding_loader.warming_up and grounding_loader.first_notice(message.channel.id):
+        bot.send_queue.enqueue(message.channel, "I'm still loading my knowledge base, so this answer doesn't use it yet.")
+
+    try:
+        async with message.channel.typing():
+            await add_turn(bot, message.channel.id, "user", message.content)
+            history = list(await bot.conversations.get(message.channel.id))
+
+            logger.info("Generating response")
+            start_time = time.time()
+            if bot.config.STREAM_RESPONSES:
+                response = await stream_reply(bot, message, history, on_text=speech.feed if speech else None)
             else:
-                logger.warning("Failed to generate TTS file")
+                response = await generate_response(bot, history, channel_id=message.channel.id,
+                                                   user_id=message.author.id,
+                                                   guild_id=message.guild.id if message.guild else None,
+                                                   priority=Priority.INTERACTIVE)
+                logger.info(f"Response generated. Length: {len(response)} characters")
+                if speech is not None:
+                    speech.feed(response)
+
+                # Truncate the response if it exceeds MAX_TEXT
+                if len(response) > bot.config.MAX_TEXT:
+                    logger.warning(f"Response exceeds MAX_TEXT ({bot.config.MAX_TEXT}). Truncating.")
+                    truncation_msg = "... (response truncated due to length)"
+                    response = response[:bot.config.MAX_TEXT - len(truncation_msg)] + truncation_msg
+
+                # Split the response into chunks of MAX_TEXT length
+                chunks = [response[i:i+bot.config.MAX_TEXT] for i in range(0, len(response), bot.config.MAX_TEXT)]
+
+                logger.info(f"Sending response in {len(chunks)} chunk(s)")
+                for index, chunk in enumerate(chunks):
+                    await bot.send_queue.send(message.channel, chunk, reference=message)
+                    if index == 0:
+                        # Measured once Discord has the message, including any wait in the send queue
+                        metrics.observe("chat.first_visible_seconds", time.time() - start_time)
+
+            await add_turn(bot, message.channel.id, "assistant", response)
+    finally:
+        if speech is not None:
+            speech.finish()
+
+    if speech is not None and not await speech.wait():
+        await bot.send_queue.send(message.channel, "I encountered an error while trying to play the audio response.")
+
+    logger.info(f"Finished handling chat message from user {message.author.name}")
+
+async def add_turn(bot, channel_id: int, role: str, content: str):
+    trimmed = await bot.conversations.append(channel_id, role, content)
+    if trimmed:
+        logger.info(f"Trimmed {len(trimmed)} turns from the conversation history of channel {channel_id}")
+        if bot.config.SUMMARIZE_HISTORY:
+            summarizer.update(bot, channel_id, trimmed)
+
+async def stream_reply(bot, message, messages: List[Dict[str, Any]],
+                       on_text: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Reply with the response while it streams in. The reply is posted as soon as the
+    first tokens arrive and then edited at most every STREAM_EDIT_INTERVAL seconds;
+    text beyond MAX_TEXT continues in a new message. on_text is called with each
+    piece of generated text. Returns the full response.
+    """
+    start_time = time.time()
+    response = ""
+    pending = ""  # Text of the message currently being written
+    shown = ""  # What that message displays on Discord right now
+    current = None
+    sent = []
+    last_edit = 0.0
+
+    async def publish(text: str):
+        nonlocal current, shown, last_edit
+        if current is None:
+            current = await bot.send_queue.send(message.channel, text, reference=message)
+            if not sent:
+                metrics.observe("chat.first_visible_seconds", time.time() - start_time)
+            sent.append(current)
+        elif text.rstrip() != shown.rstrip():
+            await current.edit(content=text)
+        shown = text
+        last_edit = time.time()
+
+    failed = False
+    lookup = await cache_lookup(bot, messages, True, message.channel.id)
+    if lookup is not None and lookup.response is not None:
+        logger.info("Response served from the response cache")
+        deltas = cached_stream(lookup.response)
+    else:
+        deltas = stream_response(bot, messages, channel_id=message.channel.id, user_id=message.author.id,
+                                 guild_id=message.guild.id if message.guild else None)
+    try:
+        async for delta in deltas:
+            response += delta
+            pending += delta
+            if on_text is not None:
+                on_text(delta)
+            while len(pending) > bot.config.MAX_TEXT:
+                # Close the current message at the last line or word break that fits
+                cut = pending.rfind("\n", 0, bot.config.MAX_TEXT)
+                if cut <= 0:
+                    cut = pending.rfind(" ", 0, bot.config.MAX_TEXT)
+                if cut <= 0:
+                    cut = bot.config.MAX_TEXT
+                await publish(pending[:cut])
+                pending = pending[cut:].lstrip()
+                current, shown = None, ""
+            if pending.strip() and (current is None or time.time() - last_edit >= bot.config.STREAM_EDIT_INTERVAL):
+                await publish(pending)
+    except Exception as e:
+        logger.error(f"Error while streaming response: {e}", exc_info=True)
+        failed = True
+        if not response:
+            response = pending = "An unexpected error occurred. Please try again later."
+    if pending.strip():
+        await publish(pending)
+    if lookup is not None and lookup.response is None and response and not failed:
+        response_cache.store(lookup, response)
+    logger.info(f"Streamed response of {len(response)} characters in {len(sent)} message(s) in {time.time() - start_time:.2f} seconds")
+    return response
 
-    logger.info(f"Finished handling chat message from user {message.author.name}")
\ No newline at end of file
+async def cached_stream(text: str) -> AsyncIterator[str]:
+    yield text
@@ -0,0 +1,73 @@
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Optional
+
+# Only the most recent observations are kept per metric, so percentiles
+# follow current behaviour and memory stays bounded
+OBSERVATION_WINDOW = 1000
+
+class Metrics:
+    """In-process counters, gauges and timing observations, reported by the !metrics command."""
+    def __init__(self):
+        self.started = time.time()
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.gauges: Dict[str, float] = {}
+        self.observations: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=OBSERVATION_WINDOW))
+
+    def increment(self, name: str, value: int = 1):
+        self.counters[name] += value
+
+    def set_gauge(self, name: str, value: float):
+        self.gauges[name] = value
+
+    def observe(self, name: str, value: float):
+        self.observations[name].append(value)
+
+    def percentile(self, name: str, percentile: float) -> Optional[float]:
+        values = sorted(self.observations.get(name, ()))
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(len(values) * percentile / 100))]
+
+    def ratio(self, name: str, other: str) -> Optional[float]:
+        """Share of name among name and other, e.g. the cache hit ratio from hits and misses."""
+        total = self.counters.get(name, 0) + self.counters.get(other, 0)
+        return self.counters.get(name, 0) / total if total else None
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "uptime": time.time() - self.started,
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+            "observations": {
+                name: {
+                    "count": len(values),
+                    "p50": self.percentile(name, 50),
+                    "p95": self.percentile(name, 95),
+                    "max": max(values),
+                }
+                for name, values in self.observations.items() if values
+            },
+        }
+
+    def format_summary(self) -> str:
+        summary = self.summary()
+        lines = [f"uptime: {summary['uptime']:.0f}s"]
+        lines += [f"{name}: {value}" for name, value in sorted(summary["counters"].items())]
+        lines += [f"{name}: {value:g}" for name, value in sorted(summary["gauges"].items())]
+        lines += [
+            f"{name}: n={stats['count']} p50={stats['p50']:.3f} p95={stats['p95']:.3f} max={stats['max']:.3f}"
+            for name, stats in sorted(summary["observations"].items())
+        ]
+        for name in sorted(summary["counters"]):
+            # Every <prefix>.hit counter is reported against its .miss or .skip sibling
+            if name.endswith(".hit"):
+                prefix = name[:-len(".hit")]
+                other = f"{prefix}.miss" if f"{prefix}.miss" in summary["counters"] else f"{prefix}.skip"
+                lines.append(f"{prefix}.hit_ratio: {self.ratio(name, other):.2%}")
+        return "\n".join(lines)
+
+    def reset(self):
+        self.__init__()
+
+metrics = Metrics()
@@ -0,0 +1,188 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+from .metrics import metrics
+from .rate_limiter import RateLimiter
+from config import Config
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+EWMA_ALPHA = 0.2
+LATENCY_WINDOW = 200
+# Hedging only starts once a provider has this many latency samples to take a percentile from
+MIN_HEDGE_SAMPLES = 20
+# Consecutive failures after which a provider is skipped for PROVIDER_COOLDOWN seconds
+MAX_CONSECUTIVE_FAILURES = 3
+# Seconds in which the error rate of a provider that gets no requests halves, so a demoted one is tried again
+ERROR_HALF_LIFE = 60.0
+
+class Provider:
+    """One LLM backend of the pool, with its latency and error statistics."""
+    def __init__(self, spec: str):
+        self.name = spec
+        self.type, self.model = spec.split("/", 1)
+        self.latency_ewma: Optional[float] = None
+        self.error_ewma = 0.0
+        self.error_updated = time.monotonic()
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+
+    def completion_kwargs(self) -> Dict[str, Any]:
+        kwargs = {"model": self.model}
+        if self.type == "openai":
+            kwargs["api_key"] = Config.OPENAI_API_KEY
+        elif self.type == "anthropic":
+            kwargs["api_key"] = Config.ANTHROPIC_API_KEY
+        elif self.type == "local":
+            kwargs["api_base"] = Config.LOCAL_LLM_URL
+        return kwargs
+
+    @property
+    def degraded(self) -> bool:
+        return time.monotonic() < self.cooldown_until or self.error_rate() > Config.PROVIDER_ERROR_THRESHOLD
+
+    def error_rate(self) -> float:
+        """The error moving average, decayed for the time since the provider's last request."""
+        return self.error_ewma * 0.5 ** ((time.monotonic() - self.error_updated) / ERROR_HALF_LIFE)
+
+    def hedge_delay(self) -> Optional[float]:
+        if Config.HEDGE_PERCENTILE <= 0 or len(self.latencies) < MIN_HEDGE_SAMPLES:
+            return None
+        values = sorted(self.latencies)
+        return values[min(len(values) - 1, int(len(values) * Config.HEDGE_PERCENTILE / 100))]
+
+    def record_success(self, latency: Optional[float]):
+        if latency is not None:
+            self.latencies.append(latency)
+            self.latency_ewma = latency if self.latency_ewma is None else \
+                EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.latency_ewma
+        self.error_ewma = (1 - EWMA_ALPHA) * self.error_rate()
+        self.error_updated = time.monotonic()
+        self.consecutive_failures = 0
+        self.report()
+
+    def record_failure(self):
+        self.error_ewma = EWMA_ALPHA + (1 - EWMA_ALPHA) * self.error_rate()
+        self.error_updated = time.monotonic()
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
+            self.cooldown_until = time.monotonic() + Config.PROVIDER_COOLDOWN
+            logger.warning(f"LLM provider {self.name} failed {self.consecutive_failures} times in a row, "
+                           f"skipping it for {Config.PROVIDER_COOLDOWN:.0f} seconds")
+        metrics.increment(f"provider.{self.name}.errors")
+        self.report()
+
+    def report(self):
+        if self.latency_ewma is not None:
+            metrics.set_gauge(f"provider.{self.name}.latency_ewma", round(self.latency_ewma, 3))
+        metrics.set_gauge(f"provider.{self.name}.error_ewma", round(self.error_rate(), 3))
+
+    def describe(self) -> str:
+        latency = f"{self.latency_ewma:.2f}s" if self.latency_ewma is not None else "n/a"
+        state = "degraded" if self.degraded else "healthy"
+        return f"{self.name}: {state}, latency {latency}, error rate {self.error_rate():.0%}"
+
+class ProviderPool:
+    """
+    Sends completions to an ordered list of providers. Healthy providers are
+    preferred in configured order. A request still running after the primary's
+    HEDGE_PERCENTILE latency gets a hedged copy on the next healthy provider,
+    charged to the rate limiter's provider budgets, and the first answer wins.
+    Failed requests fail over to the next provider.
+    """
+    def __init__(self, specs: List[str], rate_limiter: Optional[RateLimiter] = None):
+        self.providers = [Provider(spec) for spec in specs]
+        self.rate_limiter = rate_limiter
+
+    def ranked(self) -> List[Provider]:
+        # Degraded providers are kept as a last resort rather than dropped
+        return sorted(self.providers, key=lambda provider: provider.degraded)
+
+    async def attempt(self, provider: Provider, kwargs: Dict[str, Any]):
+        # litellm takes seconds to import, so it is loaded with the first request rather than at startup
+        from litellm import acompletion
+        start_time = time.monotonic()
+        try:
+            response = await acompletion(**kwargs, **provider.completion_kwargs())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            provider.record_failure()
+            logger.error(f"LLM provider {provider.name} failed: {e}")
+            raise
+        # Streams only measure the time to their first chunk, which would skew the hedging percentile
+        provider.record_success(None if kwargs.get("stream") else time.monotonic() - start_time)
+        return response
+
+    async def complete(self, estimated_tokens: int = 0, **kwargs):
+        """
+        Run a completion on the pool. kwargs are acompletion arguments without model or credentials;
+        estimated_tokens is what a hedged copy is charged to the provider token budget.
+        """
+        candidates = self.ranked()
+        if kwargs.get("stream"):
+            # A stream cannot be hedged once it started, so it only fails over on connection errors
+            return await self.complete_with_failover(candidates, kwargs)
+
+        pending: Dict[asyncio.Task, Provider] = {}
+        last_error: Optional[Exception] = None
+        next_index = 0
+
+        def launch():
+            nonlocal next_index
+            provider = candidates[next_index]
+            next_index += 1
+            pending[asyncio.ensure_future(self.attempt(provider, kwargs))] = provider
+            return provider
+
+        primary = launch()
+        # Only another healthy provider can answer faster than the one that is slow
+        can_hedge = next_index < len(candidates) and not candidates[next_index].degraded
+        hedge_delay = primary.hedge_delay() if can_hedge else None
+        hedged = False
+        try:
+            while pending:
+                timeout = hedge_delay if not hedged and hedge_delay is not None else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    if self.rate_limiter is not None and not self.rate_limiter.try_acquire_provider(estimated_tokens):
+                        metrics.increment("provider.hedges_skipped")
+                        logger.info(f"LLM request exceeded {hedge_delay:.2f}s, not hedging: provider budget exhausted")
+                        continue
+                    provider = launch()
+                    metrics.increment("provider.hedges")
+                    logger.info(f"LLM request exceeded {hedge_delay:.2f}s, hedging on {provider.name}")
+                    continue
+                for task in done:
+                    provider = pending.pop(task)
+                    if task.exception() is None:
+                        if provider is not primary:
+                            metrics.increment("provider.hedge_wins" if hedged else "provider.failovers")
+                        return task.result()
+                    last_error = task.exception()
+                if not pending and next_index < len(candidates):
+                    provider = launch()
+                    metrics.increment("provider.failover_attempts")
+                    logger.warning(f"Failing over to LLM provider {provider.name}")
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def complete_with_failover(self, candidates: List[Provider], kwargs: Dict[str, Any]):
+        last_error = None
+        for provider in candidates:
+            try:
+                return await self.attempt(provider, kwargs)
+            except Exception as e:
+                last_error = e
+        raise last_error
+
+    def describe(self) -> str:
+        return "\n".join(provider.describe() for provider in self.providers)
@@ -0,0 +1,203 @@
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from .metrics import metrics
+from config import Config
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Question text, options A to D and the correct answer letter
+Question = Tuple[str, List[str], str]
+
+NON_WORD_PATTERN = re.compile(r"[\W_]+")
+# Generation requests in a row that add nothing new before a top-up gives up
+MAX_TOP_UP_FAILURES = 3
+
+def normalize_text(text: str) -> str:
+    return NON_WORD_PATTERN.sub(" ", text).strip().lower()
+
+def question_hash(question: str) -> str:
+    """Dedupe key of a question, unaffected by case, punctuation and spacing."""
+    return hashlib.sha1(normalize_text(question).encode("utf-8")).hexdigest()
+
+class QuestionBank:
+    """
+    Trivia questions stored in SQLite per normalized topic. Each question is
+    stored once per topic under a hash of its normalized text, so generated
+    repeats are dropped without listing earlier questions in the prompt. Games
+    only take questions that have not been asked before and mark each one as
+    asked once it is posted, and a topic running low on them is topped up in
+    the background. Questions a game has queued are reserved for it until it
+    ends, so concurrent games and top-ups do not count or take them.
+    """
+    def __init__(self, db_path: str, min_fresh: int):
+        self.db_path = db_path
+        self.min_fresh = min_fresh
+        self.db: Optional[sqlite3.Connection] = None
+        self.top_ups: Dict[str, asyncio.Task] = {}
+        # A single thread owns the SQLite connection, so queries never block the event loop
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    async def take(self, topic: str, count: int, game: str) -> List[Question]:
+        """Up to count questions of the topic that have not been asked yet, reserved for the game."""
+        try:
+            questions = await self.run(self.select, normalize_text(topic), count, game)
+        except Exception as e:
+            logger.error(f"Error reading trivia questions from {self.db_path}: {e}", exc_info=True)
+            return []
+        metrics.increment("trivia.bank.served", len(questions))
+        return questions
+
+    async def add(self, topic: str, questions: List[Question], game: Optional[str] = None) -> List[Question]:
+        """
+        Store questions, skipping ones the topic already has. Returns the questions that were new,
+        which are reserved for the game if one is given.
+        """
+        if not questions:
+            return []
+        try:
+            added = await self.run(self.insert, normalize_text(topic), questions, game)
+        except Exception as e:
+            logger.error(f"Error writing trivia questions to {self.db_path}: {e}", exc_info=True)
+            # The questions can still be asked, they are just not remembered
+            return questions
+        metrics.increment("trivia.bank.duplicates", len(questions) - len(added))
+        return added
+
+    async def mark_asked(self, topic: str, question: str):
+        """Record that a question has been posted, so later games skip it."""
+        try:
+            await self.run(self.update_asked, normalize_text(topic), question_hash(question))
+        except Exception as e:
+            logger.error(f"Error marking a trivia question as asked in {self.db_path}: {e}", exc_info=True)
+
+    async def release(self, game: str):
+        """Return the questions the game reserved but never posted, so later games can ask them."""
+        try:
+            await self.run(self.update_released, game)
+        except Exception as e:
+            logger.error(f"Error releasing trivia questions in {self.db_path}: {e}", exc_info=True)
+
+    async def fresh_count(self, topic: str) -> int:
+        return await self.run(self.count_fresh, normalize_text(topic))
+
+    def top_up(self, topic: str, generate: Callable[[int], Awaitable[List[Question]]]):
+        """Generate questions in the background until the topic has min_fresh unasked ones."""
+        key = normalize_text(topic)
+        task = self.top_ups.get(key)
+        if self.min_fresh > 0 and (task is None or task.done()):
+            self.top_ups[key] = asyncio.ensure_future(self.run_top_up(topic, generate))
+
+    async def run_top_up(self, topic: str, generate: Callable[[int], Awaitable[List[Question]]]):
+        failures = 0
+        stored = 0
+        try:
+            while failures < MAX_TOP_UP_FAILURES:
+                fresh = await self.fresh_count(topic)
+                if fresh >= self.min_fresh:
+                    break
+                try:
+                    added = await self.add(topic, await generate(self.min_fresh - fresh))
+                except Exception as e:
+                    logger.error(f"Error generating trivia questions about {topic}: {e}", exc_info=True)
+                    added = []
+                failures = 0 if added else failures + 1
+                stored += len(added)
+        except Exception as e:
+            logger.error(f"Error topping up trivia questions about {topic}: {e}", exc_info=True)
+        if stored:
+            logger.info(f"Stored {stored} new trivia questions about {topic}")
+
+    async def close(self):
+        for task in self.top_ups.values():
+            task.cancel()
+        await self.run(self.close_db)
+        self.executor.shutdown()
+
+    async def run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    # The methods below run on the bank's database thread
+
+    def connect(self) -> sqlite3.Connection:
+        if self.db is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS questions ("
+                "topic TEXT NOT NULL, hash TEXT NOT NULL, question TEXT NOT NULL, options TEXT NOT NULL, "
+                "answer TEXT NOT NULL, times_asked INTEGER NOT NULL DEFAULT 0, last_asked REAL NOT NULL DEFAULT 0, "
+                "PRIMARY KEY (topic, hash))"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS questions_asked ON questions (topic, times_asked)")
+            columns = {row[1] for row in self.db.execute("PRAGMA table_info(questions)")}
+            with self.db:
+                if "reserved_by" not in columns:
+                    self.db.execute("ALTER TABLE questions ADD COLUMN reserved_by TEXT")
+                # Games do not survive a restart, so neither do their reservations
+                self.db.execute("UPDATE questions SET reserved_by = NULL WHERE reserved_by IS NOT NULL")
+        return self.db
+
+    def select(self, topic: str, count: int, game: str) -> List[Question]:
+        db = self.connect()
+        with db:
+            rows = db.execute(
+                "SELECT hash, question, options, answer FROM questions "
+                "WHERE topic = ? AND times_asked = 0 AND reserved_by IS NULL ORDER BY RANDOM() LIMIT ?",
+                (topic, count),
+            ).fetchall()
+            db.executemany(
+                "UPDATE questions SET reserved_by = ? WHERE topic = ? AND hash = ?",
+                [(game, topic, key) for key, _, _, _ in rows],
+            )
+        return [(question, json.loads(options), answer) for _, question, options, answer in rows]
+
+    def update_asked(self, topic: str, key: str):
+        db = self.connect()
+        with db:
+            db.execute(
+                "UPDATE questions SET times_asked = times_asked + 1, last_asked = ?, reserved_by = NULL "
+                "WHERE topic = ? AND hash = ?",
+                (time.time(), topic, key),
+            )
+
+    def update_released(self, game: str):
+        db = self.connect()
+        with db:
+            db.execute("UPDATE questions SET reserved_by = NULL WHERE reserved_by = ?", (game,))
+
+    def insert(self, topic: str, questions: List[Question], game: Optional[str]) -> List[Question]:
+        db = self.connect()
+        added = []
+        with db:
+            for question, options, answer in questions:
+                cursor = db.execute(
+                    "INSERT OR IGNORE INTO questions (topic, hash, question, options, answer, reserved_by) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (topic, question_hash(question), question, json.dumps(options), answer, game),
+                )
+                if cursor.rowcount:
+                    added.append((question, options, answer))
+        return added
+
+    def count_fresh(self, topic: str) -> int:
+        return self.connect().execute(
+            "SELECT COUNT(*) FROM questions WHERE topic = ? AND times_asked = 0 AND reserved_by IS NULL", (topic,)
+        ).fetchone()[0]
+
+    def close_db(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+question_bank = QuestionBank(Config.TRIVIA_DB_PATH, Config.TRIVIA_MIN_FRESH_QUESTIONS)
@@ -1,50 +1,249 @@
 import os
+import re
+import math
+import time
+import asyncio
+import hashlib
 import logging
-from typing import List, Dict
-from langchain_openai import OpenAIEmbeddings, OpenAI
-from langchain_community.vectorstores import Chroma
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_core.prompts import PromptTemplate
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.output_parsers import StrOutputParser
+from typing import List, Dict, Iterable, Optional, Set, Tuple
+from .chunking import NearDuplicateIndex, chunk_text, simhash
+from .metrics import metrics
+from .singleflight import SingleFlight, request_key
+from .retrievers import BM25Index, VectorIndex, reciprocal_rank_fusion, tokenize
 from config import Config
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Chroma accepts batches of a limited size, so large corpora are added in slices
+ADD_BATCH_SIZE = 1000
+BM25_INDEX_FILENAME = "bm25_index.json"
+
+def chunk_id(source: str, start_index: int, text: str) -> str:
+    """Stable ID for a chunk so reloads can tell new chunks from ones already stored."""
+    return hashlib.sha256(f"{source}\0{start_index}\0{text}".encode("utf-8")).hexdigest()
+
+def create_embeddings():
+    """Build the configured embedding model, cached on disk by content hash and model name."""
+    # LangChain takes seconds to import, so it is only loaded once an index is opened
+    from langchain.embeddings import CacheBackedEmbeddings
+    from langchain.storage import LocalFileStore
+    if Config.EMBEDDING_PROVIDER == "local":
+        # Optional dependency (sentence-transformers), only needed for local embeddings
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        underlying = HuggingFaceEmbeddings(model_name=Config.LOCAL_EMBEDDING_MODEL)
+    else:
+        from langchain_openai import OpenAIEmbeddings
+        underlying = OpenAIEmbeddings(model=Config.EMBEDDING_MODEL, openai_api_key=Config.OPENAI_API_KEY)
+    # Unchanged chunks are never embedded twice, even across restarts
+    return CacheBackedEmbeddings.from_bytes_store(
+        underlying,
+        LocalFileStore(Config.EMBEDDING_CACHE_DIR),
+        namespace=embedding_model_name(),
+    )
+
+def embedding_model_name() -> str:
+    return Config.LOCAL_EMBEDDING_MODEL if Config.EMBEDDING_PROVIDER == "local" else Config.EMBEDDING_MODEL
+
 class RAGSystem:
     def __init__(self):
-        logger.info("Initializing RAG System")
-        self.embeddings = OpenAIEmbeddings(openai_api_key=Config.OPENAI_API_KEY)
+        logger.info(f"Initializing RAG System (retriever: {Config.RAG_RETRIEVER})")
+        self.use_vectors = Config.RAG_RETRIEVER in ("vector", "hybrid")
+        self.use_bm25 = Config.RAG_RETRIEVER in ("bm25", "hybrid")
+        self._embeddings = None
         self.vector_store = None
-        self.retriever = None
-        self.llm = OpenAI(openai_api_key=Config.OPENAI_API_KEY)
+        self.bm25_index = None
+        self.duplicate_index = None
         self.qa_chain = None
+        self.ready = False
+        self._query_semaphore = None
+        self.embedding_flight = SingleFlight("embedding")
+
+    @property
+    def embeddings(self):
+        # Built on first use, so the bot starts without loading the embedding model
+        if self._embeddings is None and self.use_vectors:
+            self._embeddings = create_embeddings()
+        return self._embeddings
+
+    @property
+    def query_semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so the semaphore binds to the bot's running event loop
+        if self._query_semaphore is None:
+            self._query_semaphore = asyncio.Semaphore(Config.RAG_MAX_CONCURRENT_QUERIES)
+        return self._query_semaphore
+
+    def open_vector_store(self):
+        if self.vector_store is None:
+            store_name = ("grounding-" + re.sub(r"[^a-zA-Z0-9_-]", "-", embedding_model_name()))[:63]
+            if Config.VECTOR_STORE == "mmap":
+                from .vector_index import MmapVectorStore
+                self.vector_store = MmapVectorStore(
+                    os.path.join(Config.CHROMA_PERSIST_DIR, store_name),
+                    self.embeddings,
+                    dtype=Config.VECTOR_STORE_DTYPE,
+                )
+            else:
+                from langchain_community.vectorstores import Chroma
+                self.vector_store = Chroma(
+                    collection_name=store_name,
+                    embedding_function=self.embeddings,
+                    persist_directory=Config.CHROMA_PERSIST_DIR,
+                )
+        return self.vector_store
+
+    def open_bm25_index(self) -> BM25Index:
+        if self.bm25_index is None:
+            self.bm25_index = BM25Index(os.path.join(Config.CHROMA_PERSIST_DIR, BM25_INDEX_FILENAME))
+        return self.bm25_index
+
+    def indexes(self) -> List:
+        """Every index the configured retriever reads from, each kept in sync separately."""
+        indexes = []
+        if self.use_vectors:
+            vector_store = self.open_vector_store()
+            # The memory-mapped store implements the index interface itself
+            indexes.append(vector_store if Config.VECTOR_STORE == "mmap" else VectorIndex(vector_store))
+        if self.use_bm25:
+            indexes.append(self.open_bm25_index())
+        return indexes
+
+    def split_document(self, document: Dict[str, str]) -> Dict[str, Tuple[str, Dict]]:
+        """Split a document into token-bounded chunks keyed by their stable chunk ID."""
+        chunks = {}
+        for text, start_index in chunk_text(document['content'], Config.CHUNK_MAX_TOKENS, Config.CHUNK_OVERLAP_TOKENS):
+            metadata = {"source": document['filename'], "start_index": start_index, "simhash": f"{simhash(text):016x}"}
+            chunks[chunk_id(metadata["source"], metadata["start_index"], text)] = (text, metadata)
+        return chunks
+
+    def open_duplicate_index(self, indexes: List) -> Optional[NearDuplicateIndex]:
+        """SimHashes of every stored chunk, loaded once from the first index."""
+        if Config.CHUNK_DEDUP_DISTANCE < 0:
+            return None
+        if self.duplicate_index is None:
+            self.duplicate_index = NearDuplicateIndex(Config.CHUNK_DEDUP_DISTANCE)
+            for cid, metadata in indexes[0].metadatas():
+                if "simhash" in metadata:
+                    self.duplicate_index.add(cid, int(metadata["simhash"], 16), metadata.get("source"))
+        return self.duplicate_index
+
+    def drop_near_duplicates(self, source: str, chunks: Dict[str, Tuple[str, Dict]],
+                             duplicate_index: Optional[NearDuplicateIndex]) -> Set[str]:
+        """
+        Remove chunks that nearly duplicate an already indexed chunk.
+        Returns the other sources whose chunks were kept in their place.
+        """
+        kept_sources = set()
+        if duplicate_index is None:
+            return kept_sources
+        for cid, (text, metadata) in list(chunks.items()):
+            value = int(metadata["simhash"], 16)
+            kept = duplicate_index.find(value, exclude=cid)
+            if kept is not None:
+                del chunks[cid]
+                kept_sources.add(duplicate_index.sources.get(kept))
+            else:
+                duplicate_index.add(cid, value, source)
+        # Repeats within the document itself do not depend on any other source
+        kept_sources -= {None, source}
+        return kept_sources
+
+    async def embed_query(self, text: str) -> List[float]:
+        """Embed a query with the RAG embedding model; concurrent requests for the same text share one call."""
+        return await self.embedding_flight.do(request_key(embedding_model_name(), text),
+                                              lambda: self.embeddings.aembed_query(text))
+
+    def chunk_count(self) -> int:
+        # An index missing chunks the others have means a full reload is needed
+        return min(index.count() for index in self.indexes())
+
+    def sources(self) -> Set[str]:
+        """Every source with chunks in any of the indexes."""
+        return set().union(*(index.sources() for index in self.indexes()))
+
+    def update_documents(self, documents: Iterable[Dict[str, str]],
+                         removed_sources: Iterable[str] = ()) -> Dict[str, Set[str]]:
+        """
+        Re-index the given documents and drop every chunk of the removed sources.
+        Documents may be a lazy iterable; chunks are written in batches as they arrive.
+        Returns, for each document, the other sources whose chunks stand in for its near-duplicates.
+        """
+        indexes = self.indexes()
+        removed_sources = list(removed_sources)
+        stale_ids = [set() for _ in indexes]
+        new_chunks = [{} for _ in indexes]
+        for i, index in enumerate(indexes):
+            for source in removed_sources:
+                stale_ids[i] |= index.ids(source)
+        duplicate_index = self.open_duplicate_index(indexes)
+        if duplicate_index is not None:
+            for cid in stale_ids[0]:
+                duplicate_index.remove(cid)
+        added = removed = duplicates = 0
+        duplicate_of = {}
+
+        def flush():
+            nonlocal added, removed
+            for i, index in enumerate(indexes):
+                if stale_ids[i]:
+                    index.delete(stale_ids[i])
+                    removed += len(stale_ids[i])
+                    stale_ids[i].clear()
+                if new_chunks[i]:
+                    ids = list(new_chunks[i])
+                    index.add(
+                        ids,
+                        [new_chunks[i][cid][0] for cid in ids],
+                        [new_chunks[i][cid][1] for cid in ids],
+                    )
+                    added += len(ids)
+                    new_chunks[i].clear()
 
-    def load_documents(self, documents: List[Dict[str, str]]):
-        logger.info(f"Loading {len(documents)} documents into RAG system")
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500,
-            chunk_overlap=150,
-            length_function=len,
-            add_start_index=True,
-        )
-        texts = []
         for doc in documents:
-            split_texts = text_splitter.split_text(doc['content'])
-            texts.extend([(text, {"source": doc['filename'], "start_index": i * 300}) for i, text in enumerate(split_texts)])
+            chunks = self.split_document(doc)
+            if duplicate_index is not None:
+                # The previous version of a document must not count as a duplicate of the new one
+                for cid in indexes[0].ids(doc['filename']):
+                    duplicate_index.remove(cid)
+            chunk_total = len(chunks)
+            duplicate_of[doc['filename']] = self.drop_near_duplicates(doc['filename'], chunks, duplicate_index)
+            duplicates += chunk_total - len(chunks)
+            for i, index in enumerate(indexes):
+                stored = index.ids(doc['filename'])
+                stale_ids[i] |= stored - chunks.keys()
+                new_chunks[i].update((cid, chunk) for cid, chunk in chunks.items() if cid not in stored)
+            if any(len(pending) >= ADD_BATCH_SIZE for pending in new_chunks):
+                flush()
+        flush()
+        for index in indexes:
+            index.save()
         
-        logger.info(f"Split documents into {len(texts)} text chunks")
+        logger.info(f"Indexes synced: {added} chunks added, {removed} removed, "
+                    f"{duplicates} near-duplicates skipped, {self.chunk_count()} elements in total")
+        self.activate()
+        return duplicate_of
 
-        self.vector_store = Chroma.from_texts([text for text, metadata in texts], 
-                                              self.embeddings, 
-                                              metadatas=[metadata for text, metadata in texts],
-                                              persist_directory="./chroma_db")
-        
-        logger.info(f"Created vector store with {self.vector_store._collection.count()} elements")
-        
-        self.retriever = self.vector_store.as_retriever(search_kwargs={"k": 5})
+    def activate(self):
+        """Build the retrievers and QA chain over whatever the persisted indexes hold."""
+        if self.chunk_count() == 0:
+            logger.warning("Indexes are empty. RAG system will not be initialized.")
+            self.qa_chain = None
+            self.ready = False
+            return
+
+        if self.use_vectors:
+            self.open_vector_store()
+
+        if Config.RAG_MODE == "synthesize" and self.qa_chain is None:
+            self.qa_chain = self.build_qa_chain()
+        self.ready = True
+        logger.info("RAG system fully initialized and ready for queries")
+
+    def build_qa_chain(self):
+        from langchain_openai import OpenAI
+        from langchain_core.prompts import PromptTemplate
+        from langchain_core.output_parsers import StrOutputParser
 
         template = """Use the following pieces of context to answer the question at the end. 
         If you don't know the answer, just say that you don't know, don't try to make up an answer.
@@ -55,14 +254,75 @@ class RAGSystem:
         Question: {question}
         Answer:"""
         prompt = PromptTemplate.from_template(template)
+        return prompt | OpenAI(openai_api_key=Config.OPENAI_API_KEY) | StrOutputParser()
 
-        self.qa_chain = (
-            {"context": self.retriever, "question": RunnablePassthrough()}
-            | prompt
-            | self.llm
-            | StrOutputParser()
-        )
-        logger.info("RAG system fully initialized and ready for queries")
+    def has_term_overlap(self, question: str) -> bool:
+        """
+        Cheap lexical gate: False when none of the query terms found in the BM25 corpus is rarer
+        than RAG_MIN_TERM_IDF, so words that occur almost everywhere do not count as a match.
+        """
+        if not self.use_bm25:
+            return True
+        best = self.bm25_index.best_term_idf(tokenize(question))
+        return best > 0 and best >= Config.RAG_MIN_TERM_IDF
+
+    def cosine_similarity(self, relevance: float) -> float:
+        """Map a LangChain relevance score of the vector store back to cosine similarity."""
+        if Config.VECTOR_STORE == "mmap":
+            return relevance
+        # Chroma ranks by squared L2 distance, which LangChain turns into 1 - distance / sqrt(2);
+        # for the unit-length vectors of the supported models the distance is 2 - 2 * cosine
+        return 1 - (1 - relevance) / math.sqrt(2)
+
+    async def retrieve(self, question: str) -> List[Dict[str, str]]:
+        """
+        Return the top-k chunks relevant to the question, without calling an LLM.
+        Returns nothing when the question shares no distinctive terms with the corpus
+        or the best vector match is less similar than RAG_MIN_RELEVANCE.
+        """
+        if not self.ready:
+            logger.warning("Attempted to retrieve from RAG system before initialization")
+            return []
+
+        try:
+            start_time = time.time()
+            if not self.has_term_overlap(question):
+                logger.info("Skipping retrieval: no distinctive query term occurs in the grounding corpus")
+                metrics.increment("rag.gate.skip")
+                return []
+            rankings = []
+            async with self.query_semaphore:
+                if self.use_bm25:
+                    rankings.append(self.bm25_index.search(question, Config.RAG_TOP_K))
+                if self.use_vectors:
+                    scored = await self.vector_store.asimilarity_search_with_relevance_scores(
+                        question, k=Config.RAG_TOP_K)
+                    similarity = self.cosine_similarity(scored[0][1]) if scored else 0.0
+                    if scored and similarity < Config.RAG_MIN_RELEVANCE:
+                        logger.info(f"Best vector match has similarity {similarity:.3f}, below RAG_MIN_RELEVANCE")
+                        scored = []
+                    rankings.append([
+                        {
+                            "id": chunk_id(document.metadata.get("source", "unknown"),
+                                           document.metadata.get("start_index", 0),
+                                           document.page_content),
+                            "content": document.page_content,
+                            "source": document.metadata.get("source", "unknown"),
+                        }
+                        for document, _ in scored
+                    ])
+            rankings = [ranking for ranking in rankings if ranking]
+            if not rankings:
+                metrics.increment("rag.gate.skip")
+                return []
+            chunks = reciprocal_rank_fusion(rankings)[:Config.RAG_TOP_K] if len(rankings) > 1 else rankings[0]
+            metrics.increment("rag.gate.hit")
+            metrics.observe("rag.retrieve_seconds", time.time() - start_time)
+            logger.info(f"Retrieved {len(chunks)} chunks in {time.time() - start_time:.2f} seconds")
+            return chunks
+        except Exception as e:
+            logger.error(f"Error retrieving RAG context: {e}", exc_info=True)
+            return []
 
     async def query(self, question: str) -> str:
         if not self.qa_chain:
@@ -71,22 +331,44 @@ class RAGSystem:
         
         try:
             logger.info(f"Processing RAG query: {question}")
-            result = self.qa_chain.invoke(question)
-            logger.info("RAG query processed successfully")
+            start_time = time.time()
+            chunks = await self.retrieve(question)
+            if not chunks:
+                # Nothing relevant in the corpus, so the extra LLM call would only add noise
+                return ""
+            context = format_context(chunks)
+            # ainvoke keeps the completion off the event loop thread
+            async with self.query_semaphore:
+                result = await self.qa_chain.ainvoke({"context": context, "question": question})
+            logger.info(f"RAG query processed successfully in {time.time() - start_time:.2f} seconds")
             return result
         except Exception as e:
             logger.error(f"Error in RAG query: {e}", exc_info=True)
             return "An error occurred while processing your query."
 
+def format_context(chunks: List[Dict[str, str]]) -> str:
+    """Format retrieved chunks as source-attributed excerpts."""
+    return "\n\n".join(f"[Source: {chunk['source']}]\n{chunk['content']}" for chunk in chunks)
+
 rag_system = RAGSystem()
+rag_flight = SingleFlight("rag")
 
-def initialize_rag(documents: List[Dict[str, str]]):
-    logger.info("Starting RAG system initialization")
-    rag_system.load_documents(documents)
-    logger.info("RAG system initialization completed")
+def update_rag(documents: Iterable[Dict[str, str]], removed_sources: Iterable[str] = ()) -> Dict[str, Set[str]]:
+    logger.info("Starting incremental RAG system update")
+    duplicate_of = rag_system.update_documents(documents, removed_sources)
+    logger.info("RAG system update completed")
+    return duplicate_of
 
 async def rag_query(question: str) -> str:
-    logger.info(f"Received RAG query: {question}")
-    response = await rag_system.query(question)
+    # Identical questions asked at the same time share one retrieval
+    return await rag_flight.do(request_key(Config.RAG_MODE, question), lambda: run_rag_query(question))
+
+async def run_rag_query(question: str) -> str:
+    logger.info(f"Received RAG query: {question} (mode: {Config.RAG_MODE})")
+    if Config.RAG_MODE == "retrieval":
+        # Retrieved excerpts go straight into the system message, skipping the extra LLM call
+        response = format_context(await rag_system.retrieve(question))
+    else:
+        response = await rag_system.query(question)
     logger.info("RAG query response generated")
     return response
\ No newline at end of file
@@ -0,0 +1,155 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from .metrics import metrics
+from .scheduler import Priority
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Per-user and per-guild buckets of idle scopes are dropped beyond this many
+MAX_SCOPED_BUCKETS = 10000
+
+class TokenBucket:
+    """
+    Holds up to capacity tokens, refilled continuously at rate tokens per second.
+    The refill is computed from the elapsed time on each access, so every call is O(1).
+    Waiters are served one at a time by priority, and in arrival order within a priority.
+    """
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        # (priority, arrival, amount, future), most urgent first
+        self.waiters: List[Tuple[int, int, float, asyncio.Future]] = []
+        self.arrivals = itertools.count()
+        self.server: Optional[asyncio.Task] = None
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    @property
+    def waiting(self) -> bool:
+        return any(not future.done() for _, _, _, future in self.waiters)
+
+    async def acquire(self, amount: float = 1, priority: int = Priority.COMMAND) -> float:
+        """Take amount tokens, waiting until they are available. Returns the time waited."""
+        # A request larger than the bucket could never fit, so it only waits for a full bucket
+        amount = min(amount, self.capacity)
+        start_time = time.monotonic()
+        self.refill()
+        if self.tokens >= amount and not self.waiting:
+            self.tokens -= amount
+            return 0.0
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.arrivals), amount, future))
+        if self.server is None or self.server.done():
+            self.server = asyncio.create_task(self.serve())
+        # A cancelled waiter leaves its future cancelled, and serve skips it
+        await future
+        return time.monotonic() - start_time
+
+    async def serve(self):
+        """Hand out tokens to the most urgent waiter until nobody is left waiting."""
+        while self.waiters:
+            _, _, amount, future = self.waiters[0]
+            if future.done():
+                heapq.heappop(self.waiters)
+                continue
+            self.refill()
+            if self.tokens >= amount:
+                heapq.heappop(self.waiters)
+                self.tokens -= amount
+                future.set_result(None)
+                continue
+            # A more urgent waiter arriving meanwhile is at the head when this wakes up
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def try_acquire(self, amount: float = 1) -> bool:
+        """Take amount tokens only if they are available now and nobody is waiting for them."""
+        amount = min(amount, self.capacity)
+        if self.waiting:
+            return False
+        self.refill()
+        if self.tokens < amount:
+            return False
+        self.tokens -= amount
+        return True
+
+    def adjust(self, amount: float):
+        """Return unused tokens (positive) or take extra ones (negative) after the fact."""
+        self.refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+class RateLimiter:
+    """
+    Token buckets per user, per guild and global, plus provider-wide request
+    and token budgets. A limit of 0 or less disables that bucket.
+    """
+    def __init__(self, user_rpm: float, guild_rpm: float, global_rpm: float, window: float,
+                 provider_rpm: float = 0, provider_tpm: float = 0):
+        self.user_rpm = user_rpm
+        self.guild_rpm = guild_rpm
+        self.user_buckets: "OrderedDict[int, TokenBucket]" = OrderedDict()
+        self.guild_buckets: "OrderedDict[int, TokenBucket]" = OrderedDict()
+        self.global_bucket = TokenBucket(global_rpm, global_rpm / window) if global_rpm > 0 else None
+        self.provider_requests = TokenBucket(provider_rpm, provider_rpm / 60) if provider_rpm > 0 else None
+        self.provider_tokens = TokenBucket(provider_tpm, provider_tpm / 60) if provider_tpm > 0 else None
+
+    def scoped_bucket(self, buckets: "OrderedDict[int, TokenBucket]", key: int, rpm: float) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(rpm, rpm / 60)
+            if len(buckets) > MAX_SCOPED_BUCKETS:
+                # The least recently used scope has long since refilled, so dropping it loses nothing
+                buckets.popitem(last=False)
+        buckets.move_to_end(key)
+        return bucket
+
+    async def acquire(self, user_id: Optional[int] = None, guild_id: Optional[int] = None, tokens: int = 0,
+                      priority: Priority = Priority.COMMAND):
+        """
+        Wait until the request fits every applicable bucket, narrowest scope first.
+        While a bucket is empty, more urgent requests get its tokens first.
+        """
+        buckets = []
+        if user_id is not None and self.user_rpm > 0:
+            buckets.append(("user", self.scoped_bucket(self.user_buckets, user_id, self.user_rpm), 1))
+        if guild_id is not None and self.guild_rpm > 0:
+            buckets.append(("guild", self.scoped_bucket(self.guild_buckets, guild_id, self.guild_rpm), 1))
+        if self.global_bucket is not None:
+            buckets.append(("global", self.global_bucket, 1))
+        if self.provider_requests is not None:
+            buckets.append(("provider_requests", self.provider_requests, 1))
+        if self.provider_tokens is not None and tokens:
+            buckets.append(("provider_tokens", self.provider_tokens, tokens))
+        for name, bucket, amount in buckets:
+            waited = await bucket.acquire(amount, priority)
+            if waited > 0.01:
+                logger.warning(f"Rate limit reached ({name}). Waited {waited:.2f} seconds.")
+                metrics.increment(f"rate_limit.{name}.waits")
+                metrics.observe("rate_limit.wait_seconds", waited)
+
+    def try_acquire_provider(self, tokens: int = 0) -> bool:
+        """Charge an extra request to the provider budgets if they have room for it right now."""
+        if self.provider_requests is not None and not self.provider_requests.try_acquire():
+            return False
+        if self.provider_tokens is not None and tokens and not self.provider_tokens.try_acquire(tokens):
+            if self.provider_requests is not None:
+                # Give back the request taken above, since the request is not sent after all
+                self.provider_requests.adjust(1)
+            return False
+        return True
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: int):
+        """Correct the provider token budget once the response reports its real usage."""
+        if self.provider_tokens is not None:
+            self.provider_tokens.adjust(estimated_tokens - actual_tokens)
@@ -0,0 +1,112 @@
+import re
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import numpy as np
+from .metrics import metrics
+from config import Config
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+def normalize_prompt(text: str) -> str:
+    return WHITESPACE_PATTERN.sub(" ", text).strip().lower()
+
+class CacheEntry:
+    __slots__ = ("response", "expires", "scope", "vector")
+
+    def __init__(self, response: str, expires: float, scope: str, vector: Optional[np.ndarray]):
+        self.response = response
+        self.expires = expires
+        self.scope = scope
+        self.vector = vector
+
+class CacheLookup:
+    """Result of a lookup, kept so a miss can be stored without hashing or embedding the prompt again."""
+    __slots__ = ("key", "scope", "vector", "response")
+
+    def __init__(self, key: str, scope: str, vector: Optional[np.ndarray], response: Optional[str]):
+        self.key = key
+        self.scope = scope
+        self.vector = vector
+        self.response = response
+
+class ResponseCache:
+    """
+    LRU cache of LLM responses with a TTL. The exact tier matches the normalized
+    prompt under the same scope (model, settings and any other inputs that change
+    the answer). The optional semantic tier matches single-message prompts whose
+    embedding has at least similarity_threshold cosine similarity with a cached one.
+    """
+    def __init__(self, max_entries: int, ttl: float, similarity_threshold: float = 0.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def scope(**inputs: Any) -> str:
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    async def lookup(self, scope: str, messages: List[Dict[str, Any]],
+                     embed: Optional[Callable[[str], Awaitable[List[float]]]] = None) -> CacheLookup:
+        prompt = [(message['role'], normalize_prompt(message['content'])) for message in messages]
+        key = hashlib.sha256(json.dumps([scope, prompt]).encode("utf-8")).hexdigest()
+        entry = self.entries.get(key)
+        if entry is not None and entry.expires < time.time():
+            del self.entries[key]
+            entry = None
+        if entry is not None:
+            self.entries.move_to_end(key)
+            metrics.increment("response_cache.exact.hit")
+            return CacheLookup(key, scope, entry.vector, entry.response)
+        metrics.increment("response_cache.exact.miss")
+
+        vector = None
+        if self.similarity_threshold > 0 and embed is not None and len(messages) == 1:
+            try:
+                vector = np.asarray(await embed(messages[0]['content']), dtype=np.float32)
+                vector /= np.linalg.norm(vector) or 1.0
+            except Exception as e:
+                logger.error(f"Error embedding prompt for the response cache: {e}", exc_info=True)
+            if vector is not None:
+                match = self.nearest(scope, vector)
+                metrics.increment("response_cache.semantic.hit" if match else "response_cache.semantic.miss")
+                if match is not None:
+                    return CacheLookup(key, scope, vector, match.response)
+        return CacheLookup(key, scope, vector, None)
+
+    def nearest(self, scope: str, vector: np.ndarray) -> Optional[CacheEntry]:
+        now = time.time()
+        candidates = [entry for entry in self.entries.values()
+                      if entry.vector is not None and entry.scope == scope and entry.expires >= now]
+        if not candidates:
+            return None
+        similarities = np.stack([entry.vector for entry in candidates]) @ vector
+        best = int(np.argmax(similarities))
+        return candidates[best] if similarities[best] >= self.similarity_threshold else None
+
+    def store(self, lookup: CacheLookup, response: str):
+        self.entries[lookup.key] = CacheEntry(response, time.time() + self.ttl, lookup.scope, lookup.vector)
+        self.entries.move_to_end(lookup.key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        metrics.set_gauge("response_cache.entries", len(self.entries))
+
+    def clear(self):
+        if self.entries:
+            logger.info(f"Cleared {len(self.entries)} cached responses")
+        self.entries.clear()
+        metrics.set_gauge("response_cache.entries", 0)
+
+response_cache = ResponseCache(Config.RESPONSE_CACHE_SIZE, Config.RESPONSE_CACHE_TTL, Config.RESPONSE_CACHE_SIMILARITY)
@@ -0,0 +1,192 @@
+import os
+import re
+import json
+import math
+import heapq
+import logging
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Very common words are left out of the inverted index: they carry almost no
+# BM25 weight and their posting lists would dominate lookup time
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i in is it its of on or "
+    "that the this to was were will with you your".split()
+)
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+def reciprocal_rank_fusion(rankings: List[List[Dict[str, Any]]], k: int = 60) -> List[Dict[str, Any]]:
+    """Merge ranked chunk lists by summing 1 / (k + rank) for every list a chunk appears in."""
+    scores = defaultdict(float)
+    chunks = {}
+    for ranking in rankings:
+        for rank, chunk in enumerate(ranking, start=1):
+            scores[chunk["id"]] += 1.0 / (k + rank)
+            chunks.setdefault(chunk["id"], chunk)
+    return [chunks[cid] for cid in sorted(scores, key=scores.get, reverse=True)]
+
+class BM25Index:
+    """
+    In-process inverted index scored with Okapi BM25.
+    Chunks are persisted as JSON and the postings are rebuilt on load. Loads
+    write from a worker thread while searches read on the event loop, so every
+    access holds the lock; writes take it per chunk to keep searches responsive.
+    """
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.documents: Dict[str, tuple] = {}  # Chunk ID: (text, metadata)
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)  # Term: {Chunk ID: term frequency}
+        self.lengths: Dict[str, int] = {}
+        self.source_ids: Dict[str, Set[str]] = defaultdict(set)
+        self.total_length = 0
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                documents = json.load(file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable BM25 index {self.path}: {e}")
+            return
+        ids = list(documents)
+        self.add(ids, [documents[cid][0] for cid in ids], [documents[cid][1] for cid in ids])
+        logger.info(f"Loaded BM25 index with {len(self.documents)} chunks")
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with self.lock:
+            documents = dict(self.documents)
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(documents, file)
+        os.replace(temp_path, self.path)
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]):
+        for cid, text, metadata in zip(ids, texts, metadatas):
+            terms = Counter(tokenize(text))
+            with self.lock:
+                if cid in self.documents:
+                    continue
+                for term, frequency in terms.items():
+                    self.postings[term][cid] = frequency
+                length = sum(terms.values())
+                self.lengths[cid] = length
+                self.total_length += length
+                self.documents[cid] = (text, metadata)
+                self.source_ids[metadata.get("source")].add(cid)
+
+    def delete(self, ids: Iterable[str]):
+        for cid in ids:
+            with self.lock:
+                document = self.documents.pop(cid, None)
+                if document is None:
+                    continue
+                text, metadata = document
+                for term in set(tokenize(text)):
+                    postings = self.postings.get(term)
+                    if postings is not None:
+                        postings.pop(cid, None)
+                        if not postings:
+                            del self.postings[term]
+                self.total_length -= self.lengths.pop(cid)
+                source_ids = self.source_ids.get(metadata.get("source"))
+                if source_ids is not None:
+                    source_ids.discard(cid)
+                    if not source_ids:
+                        del self.source_ids[metadata.get("source")]
+
+    def ids(self, source: Optional[str] = None) -> Set[str]:
+        with self.lock:
+            if source is None:
+                return set(self.documents)
+            return set(self.source_ids.get(source, ()))
+
+    def sources(self) -> Set[str]:
+        with self.lock:
+            return set(self.source_ids)
+
+    def metadatas(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        with self.lock:
+            items = [(cid, metadata) for cid, (_, metadata) in self.documents.items()]
+        yield from items
+
+    def count(self) -> int:
+        return len(self.documents)
+
+    def idf(self, document_frequency: int) -> float:
+        document_count = len(self.documents)
+        return math.log(1 + (document_count - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def best_term_idf(self, terms: Iterable[str]) -> float:
+        """
+        IDF of the rarest term that occurs in the corpus, relative to a term found in a
+        single chunk: 1.0 for such a term, near 0 for one found everywhere, 0 if none occurs.
+        """
+        with self.lock:
+            frequencies = [len(self.postings[term]) for term in set(terms) if term in self.postings]
+            if not frequencies:
+                return 0.0
+            return self.idf(min(frequencies)) / self.idf(1)
+
+    def search(self, query: str, k: int) -> List[Dict[str, Any]]:
+        terms = set(tokenize(query))
+        with self.lock:
+            if not self.documents:
+                return []
+            average_length = self.total_length / len(self.documents) or 1.0
+            scores = defaultdict(float)
+            for term in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = self.idf(len(postings))
+                for cid, frequency in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.lengths[cid] / average_length)
+                    scores[cid] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+            results = []
+            for cid, score in heapq.nlargest(k, scores.items(), key=lambda item: item[1]):
+                text, metadata = self.documents[cid]
+                results.append({"id": cid, "content": text, "source": metadata.get("source", "unknown"), "score": score})
+        return results
+
+class VectorIndex:
+    """Gives a LangChain vector store the same add/delete/ids interface as BM25Index."""
+    def __init__(self, vector_store):
+        self.vector_store = vector_store
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]):
+        self.vector_store.add_texts(texts, metadatas=metadatas, ids=ids)
+
+    def delete(self, ids: Iterable[str]):
+        self.vector_store.delete(ids=list(ids))
+
+    def ids(self, source: Optional[str] = None) -> Set[str]:
+        where = {"source": source} if source is not None else None
+        return set(self.vector_store.get(where=where, include=[])["ids"])
+
+    def sources(self) -> Set[str]:
+        return {metadata["source"] for metadata in self.vector_store.get(include=["metadatas"])["metadatas"]}
+
+    def metadatas(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        stored = self.vector_store.get(include=["metadatas"])
+        return zip(stored["ids"], stored["metadatas"])
+
+    def count(self) -> int:
+        return self.vector_store._collection.count()
+
+    def save(self):
+        # Chroma persists every write itself
+        pass
@@ -0,0 +1,83 @@
+import time
+import asyncio
+import logging
+from enum import IntEnum
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional
+from .metrics import metrics
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # Replies to mentions and DMs
+    COMMAND = 1  # Commands such as !translate and trivia questions
+    BACKGROUND = 2  # Summaries and prefetching nobody is waiting for
+
+class LLMScheduler:
+    """
+    Admits at most max_concurrency LLM calls at a time. Waiting calls are served
+    by priority class, and within a class round-robin across guilds, so one busy
+    guild cannot starve the others.
+    """
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        # Priority: {guild ID: waiting futures}, guilds in round-robin order
+        self.queues: Dict[Priority, "OrderedDict[Optional[int], Deque[asyncio.Future]]"] = {
+            priority: OrderedDict() for priority in Priority
+        }
+        self.waiting = 0
+
+    async def acquire(self, priority: Priority = Priority.COMMAND, guild_id: Optional[int] = None):
+        """Wait for a free slot. Every acquire must be paired with a release."""
+        start_time = time.monotonic()
+        if self.in_flight < self.max_concurrency and not self.waiting:
+            self.in_flight += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self.queues[priority].setdefault(guild_id, deque()).append(future)
+            self.waiting += 1
+            self.report()
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # The slot was handed over just as the caller gave up, so pass it on
+                    self.release()
+                raise
+        wait_time = time.monotonic() - start_time
+        metrics.observe(f"llm.queue_wait_seconds.{priority.name.lower()}", wait_time)
+        if wait_time > 1:
+            logger.info(f"LLM request ({priority.name.lower()}) waited {wait_time:.2f} seconds for a slot")
+        self.report()
+
+    def release(self):
+        self.in_flight -= 1
+        while self.in_flight < self.max_concurrency:
+            future = self.next_waiter()
+            if future is None:
+                break
+            self.in_flight += 1
+            future.set_result(None)
+        self.report()
+
+    def next_waiter(self) -> Optional[asyncio.Future]:
+        for priority in Priority:
+            queues = self.queues[priority]
+            while queues:
+                guild_id, queue = next(iter(queues.items()))
+                future = queue.popleft()
+                if queue:
+                    queues.move_to_end(guild_id)
+                else:
+                    del queues[guild_id]
+                self.waiting -= 1
+                if not future.done():
+                    return future
+        return None
+
+    def report(self):
+        metrics.set_gauge("llm.in_flight", self.in_flight)
+        metrics.set_gauge("llm.queue_depth", self.waiting)
@@ -0,0 +1,115 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Deque, List, Optional
+import discord
+from .metrics import metrics
+from .rate_limiter import TokenBucket
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Queues of idle channels are dropped beyond this many
+MAX_CHANNEL_QUEUES = 10000
+
+class OutgoingMessage:
+    __slots__ = ("content", "reference", "future", "queued")
+
+    def __init__(self, content: str, reference: Optional[discord.Message], future: asyncio.Future):
+        self.content = content
+        self.reference = reference
+        self.future = future
+        self.queued = time.monotonic()
+
+class ChannelQueue:
+    __slots__ = ("channel", "pending", "bucket", "worker")
+
+    def __init__(self, channel, bucket: TokenBucket):
+        self.channel = channel
+        self.pending: Deque[OutgoingMessage] = deque()
+        self.bucket = bucket
+        self.worker: Optional[asyncio.Task] = None
+
+class SendQueue:
+    """
+    Outbound messages per channel, sent in order. Each channel's sends are paced
+    by a token bucket of burst messages refilled at rate messages per second, in
+    line with Discord's per-channel limit. Messages that pile up while a channel
+    waits for its budget are joined into one, up to max_text characters.
+    Replies are always sent on their own.
+    """
+    def __init__(self, max_text: int, rate: float, burst: int):
+        self.max_text = max_text
+        self.rate = rate
+        self.burst = burst
+        self.channels: "OrderedDict[int, ChannelQueue]" = OrderedDict()
+        self.depth = 0
+
+    def enqueue(self, channel, content: str, reference: Optional[discord.Message] = None) -> asyncio.Future:
+        """Queue a message without waiting for it. The future resolves to the Discord message it went out in."""
+        queue = self.channels.get(channel.id)
+        if queue is None:
+            queue = self.channels[channel.id] = ChannelQueue(channel, TokenBucket(self.burst, self.rate))
+            self.evict_idle()
+        self.channels.move_to_end(channel.id)
+
+        future = asyncio.get_running_loop().create_future()
+        # Failures are logged when they happen, so callers that do not wait need not check them
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())
+        queue.pending.append(OutgoingMessage(content, reference, future))
+        self.depth += 1
+        metrics.set_gauge("send_queue.depth", self.depth)
+        if queue.worker is None or queue.worker.done():
+            queue.worker = asyncio.ensure_future(self.run(queue))
+        return future
+
+    async def send(self, channel, content: str, reference: Optional[discord.Message] = None) -> discord.Message:
+        """Queue a message and wait until it has been sent."""
+        return await self.enqueue(channel, content, reference)
+
+    async def run(self, queue: ChannelQueue):
+        while queue.pending:
+            await queue.bucket.acquire()
+            # Taken after the wait, so everything queued in the meantime can be joined
+            batch = self.next_batch(queue.pending)
+            self.depth -= len(batch)
+            metrics.set_gauge("send_queue.depth", self.depth)
+            if len(batch) > 1:
+                metrics.increment("send_queue.coalesced", len(batch) - 1)
+            try:
+                sent = await queue.channel.send("\n".join(message.content for message in batch),
+                                                reference=batch[0].reference)
+            except Exception as e:
+                logger.error(f"Error sending message to channel {queue.channel.id}: {e}", exc_info=True)
+                metrics.increment("send_queue.errors")
+                for message in batch:
+                    if not message.future.done():
+                        message.future.set_exception(e)
+                continue
+            now = time.monotonic()
+            for message in batch:
+                metrics.observe("send_queue.latency_seconds", now - message.queued)
+                if not message.future.done():
+                    message.future.set_result(sent)
+
+    def next_batch(self, pending: Deque[OutgoingMessage]) -> List[OutgoingMessage]:
+        batch = [pending.popleft()]
+        if batch[0].reference is not None:
+            # Replies go out alone: streamed replies are edited later, which would erase anything joined to them
+            return batch
+        length = len(batch[0].content)
+        # Replies start a new message so they stay attached to what they answer
+        while pending and pending[0].reference is None and length + 1 + len(pending[0].content) <= self.max_text:
+            message = pending.popleft()
+            length += 1 + len(message.content)
+            batch.append(message)
+        return batch
+
+    def evict_idle(self):
+        while len(self.channels) > MAX_CHANNEL_QUEUES:
+            channel_id, queue = next(iter(self.channels.items()))
+            if queue.pending:
+                break
+            del self.channels[channel_id]
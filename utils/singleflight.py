@@ -0,0 +1,36 @@
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+from .metrics import metrics
+
+T = TypeVar("T")
+
+def request_key(*parts: Any) -> str:
+    """Stable key for a request made of JSON-serializable parts."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller starts the
+    work and every caller that arrives before it finishes awaits the same result.
+    The shared work keeps running if the caller that started it is cancelled.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.calls: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, function: Callable[[], Awaitable[T]]) -> T:
+        future = self.calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(function())
+            self.calls[key] = future
+            future.add_done_callback(lambda done: self.forget(key, done))
+            metrics.increment(f"singleflight.{self.name}.leader")
+        else:
+            metrics.increment(f"singleflight.{self.name}.shared")
+        return await asyncio.shield(future)
+
+    def forget(self, key: str, future: asyncio.Future):
+        if self.calls.get(key) is future:
+            del self.calls[key]
@@ -1,9 +1,24 @@
 import asyncio
+import logging
 import random
 import re
-from typing import Dict, List
+import time
+import uuid
+from typing import Dict, List, Optional
 from collections import defaultdict
 import discord
+from .metrics import metrics
+from .question_bank import Question, question_bank
+from .scheduler import Priority
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+ANSWER_LETTERS = {'A', 'B', 'C', 'D'}
+# Players named in a round's results; the rest are only counted, to keep the message short
+MAX_LISTED_PLAYERS = 20
+QUESTION_PATTERN = re.compile(r"Question: (.*?)\nA: (.*?)\nB: (.*?)\nC: (.*?)\nD: (.*?)\nAnswer: (.)", re.DOTALL)
 
 class TriviaGame:
     def __init__(self, bot, channel, topic):
@@ -16,108 +31,177 @@ class TriviaGame:
         self.current_options = []
         self.question_count = 0
         self.max_questions = 5
-        self.asked_questions: List[str] = []  # To keep track of asked questions
         self.answer_timeout = 15.0  # Seconds to wait for answers
+        self.max_attempts = 5  # Failed generation requests in a row before giving up
+        self.questions: asyncio.Queue = asyncio.Queue()  # Generated questions not asked yet
+        self.producer: Optional[asyncio.Task] = None
+        self.reservation = uuid.uuid4().hex  # Marks the stored questions queued for this game
+        self.answers: Dict[int, str] = {}  # User ID: answer to the current question
+        self.accepting_answers = False
+        self.stopped = asyncio.Event()
         self.is_active = True
 
-    async def generate_question(self):
-        attempts = 5  # Increase attempts to allow for more variety
-        for attempt in range(attempts):
-            prompt = (
-                f"Generate a multiple choice trivia question about {self.topic}. "
-                f"This is question number {self.question_count + 1} out of {self.max_questions}. "
-                "Make sure it's different from these previously asked questions: "
-                f"{', '.join(self.asked_questions)}. "
-                "Provide the question, four options (A, B, C, D), and the correct answer letter in the following format:\n"
-                "Question: [Your question here]\n"
-                "A: [Option A]\n"
-                "B: [Option B]\n"
-                "C: [Option C]\n"
-                "D: [Option D]\n"
-                "Answer: [Correct answer letter]"
-            )
-            response = await self.bot.generate_response([{"role": "user", "content": prompt}])
-            
-            # Use regex to extract question, options, and answer
-            match = re.search(r"Question: (.*?)\nA: (.*?)\nB: (.*?)\nC: (.*?)\nD: (.*?)\nAnswer: (.)", response, re.DOTALL)
-            if match:
-                question, optionA, optionB, optionC, optionD, answer = match.groups()
-                question = question.strip()
-                options = [optionA.strip(), optionB.strip(), optionC.strip(), optionD.strip()]
-                answer = answer.strip().upper()
-                
-                # Check if this question is unique
-                if question not in self.asked_questions:
-                    self.asked_questions.append(question)
-                    return question, options, answer
-        
-        # If we couldn't generate a unique question after several attempts, raise an exception
-        raise ValueError(f"Failed to generate a unique question about {self.topic} after {attempts} attempts.")
+    async def generate_questions(self, count: int, priority: Priority = Priority.BACKGROUND) -> List[Question]:
+        """Generate up to count questions in one request. Returns the well-formed ones."""
+        prompt = (
+            f"Generate {count} different multiple choice trivia question{'s' if count != 1 else ''} about {self.topic}. "
+            "For each question provide the question, four options (A, B, C, D), and the correct answer letter "
+            "in the following format, separating the questions with a blank line:\n"
+            "Question: [Your question here]\n"
+            "A: [Option A]\n"
+            "B: [Option B]\n"
+            "C: [Option C]\n"
+            "D: [Option D]\n"
+            "Answer: [Correct answer letter]"
+        )
+        response = await self.bot.generate_response(
+            [{"role": "user", "content": prompt}],
+            use_grounding=False,
+            use_cache=False,
+            guild_id=self.channel.guild.id if self.channel.guild else None,
+            priority=priority,
+        )
+
+        questions = []
+        # A response cut off by max_tokens still yields its complete questions
+        for match in QUESTION_PATTERN.finditer(response):
+            question, optionA, optionB, optionC, optionD, answer = match.groups()
+            question = question.strip()
+            options = [optionA.strip(), optionB.strip(), optionC.strip(), optionD.strip()]
+            answer = answer.strip().upper()
+
+            if answer in ['A', 'B', 'C', 'D']:
+                questions.append((question, options, answer))
+        return questions
+
+    async def produce_questions(self):
+        """
+        Provide the questions of the game in the background. Stored questions
+        nobody has been asked yet come first; the rest of the round is requested
+        at once, and whatever is still missing is requested again while the
+        players answer the questions already provided.
+        """
+        produced = 0
+        failures = 0
+        try:
+            for question in await question_bank.take(self.topic, self.max_questions, self.reservation):
+                self.questions.put_nowait(question)
+                produced += 1
+            # Players are only waiting on generation when the bank had nothing for them
+            priority = Priority.BACKGROUND if produced else Priority.COMMAND
+            while produced < self.max_questions and self.is_active:
+                needed = self.max_questions - produced
+                try:
+                    questions = await self.generate_questions(needed, priority)
+                    # Surplus questions are kept for later games
+                    await question_bank.add(self.topic, questions[needed:])
+                    # Questions the bank already has may have been asked before
+                    questions = await question_bank.add(self.topic, questions[:needed], self.reservation)
+                except Exception as e:
+                    logger.error(f"Error generating trivia questions about {self.topic}: {e}", exc_info=True)
+                    questions = []
+                if not questions:
+                    failures += 1
+                    if failures >= self.max_attempts:
+                        break
+                    continue
+                failures = 0
+                priority = Priority.BACKGROUND
+                for question in questions:
+                    self.questions.put_nowait(question)
+                    produced += 1
+        finally:
+            # Tells the game that no further questions are coming
+            self.questions.put_nowait(None)
+            question_bank.top_up(self.topic, self.generate_questions)
+
+    def submit_answer(self, message) -> bool:
+        """Record a player's answer to the current question. Returns False if the message is not an answer."""
+        answer = message.content.strip().upper()
+        if not self.accepting_answers or answer not in ANSWER_LETTERS:
+            return False
+        # Only a player's first answer to a question counts
+        self.answers.setdefault(message.author.id, answer)
+        metrics.increment("trivia.answers")
+        return True
 
     async def wait_for_answers(self):
-        answered_players = set()
-        start_time = asyncio.get_event_loop().time()
-
-        while asyncio.get_event_loop().time() - start_time < self.answer_timeout and self.is_active:
-            try:
-                message = await self.bot.wait_for(
-                    'message',
-                    timeout=self.answer_timeout - (asyncio.get_event_loop().time() - start_time),
-                    check=lambda m: m.channel == self.channel and not m.author.bot
-                )
-                
-                if message.content.lower() == '!stop_trivia' and message.author.guild_permissions.administrator:
-                    self.is_active = False
-                    await self.channel.send("Trivia game stopped by an administrator.")
-                    return
-
-                if message.author.id not in answered_players:
-                    answered_players.add(message.author.id)
-                    if message.content.upper() == self.current_answer:
-                        await self.channel.send(f"Correct, {message.author.mention}!")
-                        self.players[message.author.id] += 1
-                    elif message.content.upper() in ['A', 'B', 'C', 'D']:
-                        await self.channel.send(f"Sorry {message.author.mention}, that's incorrect.")
-                    else:
-                        await self.channel.send(f"{message.author.mention}, please answer with A, B, C, or D.")
-
-            except asyncio.TimeoutError:
-                break
+        self.answers = {}
+        self.accepting_answers = True
+        try:
+            await asyncio.wait_for(self.stopped.wait(), timeout=self.answer_timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.accepting_answers = False
 
         if self.is_active:
-            await self.channel.send(f"Time's up! The correct answer was: {self.current_answer}")
+            # Not awaited, so the summary can share a message with whatever is sent next
+            self.bot.send_queue.enqueue(self.channel, self.round_summary())
+
+    def round_summary(self) -> str:
+        correct = [player_id for player_id, answer in self.answers.items() if answer == self.current_answer]
+        for player_id in correct:
+            self.players[player_id] += 1
+
+        summary = f"Time's up! The correct answer was: {self.current_answer}\n"
+        if not self.answers:
+            return summary + "Nobody answered."
+        summary += f"{len(correct)} of {len(self.answers)} player{'s' if len(self.answers) != 1 else ''} answered correctly"
+        if correct:
+            summary += ": " + ", ".join(f"<@{player_id}>" for player_id in correct[:MAX_LISTED_PLAYERS])
+            if len(correct) > MAX_LISTED_PLAYERS:
+                summary += f" and {len(correct) - MAX_LISTED_PLAYERS} more"
+        return summary + "!"
+
+    def stop(self):
+        """End the game, also cutting short the question being answered."""
+        self.is_active = False
+        self.stopped.set()
 
     async def start_game(self):
-        await self.channel.send(f"Starting a trivia game on the topic of {self.topic}! Get ready!")
+        # Generation starts right away and overlaps with the announcement
+        self.producer = asyncio.ensure_future(self.produce_questions())
+        self.bot.send_queue.enqueue(self.channel, f"Starting a trivia game on the topic of {self.topic}! Get ready!")
         await asyncio.sleep(2)
 
-        while self.question_count < self.max_questions and self.is_active:
-            self.question_count += 1
-            try:
-                self.current_question, self.current_options, self.current_answer = await self.generate_question()
-            except ValueError as e:
-                await self.channel.send(f"Error generating question: {str(e)}")
-                continue
-
-            question_text = f"Question {self.question_count}: {self.current_question}\n"
-            for i, option in enumerate(['A', 'B', 'C', 'D']):
-                question_text += f"{option}: {self.current_options[i]}\n"
-            
-            await self.channel.send(question_text)
-            await self.wait_for_answers()
-            if self.is_active:
-                await asyncio.sleep(2)
+        try:
+            while self.question_count < self.max_questions and self.is_active:
+                wait_start = time.monotonic()
+                question = await self.questions.get()
+                metrics.observe("trivia.question_wait_seconds", time.monotonic() - wait_start)
+                if question is None:
+                    await self.bot.send_queue.send(self.channel, f"Error generating question: Failed to generate "
+                                                   f"a unique question about {self.topic} after {self.max_attempts} attempts.")
+                    break
+                self.question_count += 1
+                self.current_question, self.current_options, self.current_answer = question
+
+                question_text = f"Question {self.question_count}: {self.current_question}\n"
+                for i, option in enumerate(['A', 'B', 'C', 'D']):
+                    question_text += f"{option}: {self.current_options[i]}\n"
+
+                await self.bot.send_queue.send(self.channel, question_text)
+                # Only questions that were actually posted are used up
+                await question_bank.mark_asked(self.topic, self.current_question)
+                await self.wait_for_answers()
+                if self.is_active:
+                    await asyncio.sleep(2)
+        finally:
+            self.producer.cancel()
+            # Runs after any write of the producer on the bank's single database thread
+            await question_bank.release(self.reservation)
 
         if self.is_active:
             await self.end_game()
 
     async def end_game(self):
         if not self.players:
-            await self.channel.send("The trivia game has ended. No one scored any points!")
+            self.bot.send_queue.enqueue(self.channel, "The trivia game has ended. No one scored any points!")
         else:
             winner = max(self.players, key=self.players.get)
             winner_user = self.channel.guild.get_member(winner)
-            await self.channel.send(f"The trivia game has ended! The winner is {winner_user.mention} with {self.players[winner]} points!")
+            self.bot.send_queue.enqueue(self.channel, f"The trivia game has ended! The winner is {winner_user.mention} with {self.players[winner]} points!")
 
         # Create a summary of the final scores
         sorted_players = sorted(self.players.items(), key=lambda x: x[1], reverse=True)
@@ -137,7 +221,7 @@ class TriviaGame:
         summary += f"Total Players: {total_players}\n"
         summary += f"Average Score: {average_score:.2f}\n"
 
-        await self.channel.send(summary)
+        await self.bot.send_queue.send(self.channel, summary)
 
-# Global dictionary to store active games
-active_games = {}
\ No newline at end of file
+# Active games by channel ID; the bot's on_message hands answers to them
+active_games: Dict[int, TriviaGame] = {}
@@ -1,9 +1,38 @@
 import asyncio
-import os
-import openai
+import io
+import re
+import time
+import logging
+from typing import Dict, List, Optional
+import discord
+from .metrics import metrics
 from config import Config
 
-async def generate_tts(text: str) -> str:
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SENTENCE_BREAK = re.compile(r'(?<=[.!?])["\')\]]*\s+|\n+')
+# Fragments shorter than this are spoken together with the next sentence instead of costing a request of their own
+MIN_SENTENCE_CHARS = 20
+
+def split_sentences(text: str) -> List[str]:
+    """Split text at sentence boundaries. The last piece is what follows the final boundary, possibly empty."""
+    pieces = SENTENCE_BREAK.split(text)
+    sentences = []
+    current = ""
+    for piece in pieces[:-1]:
+        current = f"{current} {piece}" if current else piece
+        if len(current.strip()) >= MIN_SENTENCE_CHARS:
+            sentences.append(current)
+            current = ""
+    sentences.append(f"{current} {pieces[-1]}" if current else pieces[-1])
+    return sentences
+
+async def synthesize(text: str) -> Optional[bytes]:
+    """Synthesize text into audio held in memory."""
+    # Only needed once the bot speaks, so it stays out of startup
+    import openai
     try:
         loop = asyncio.get_running_loop()
         response = await loop.run_in_executor(None, lambda: openai.audio.speech.create(
@@ -11,18 +40,169 @@ async def generate_tts(text: str) -> str:
             voice=Config.TTS_VOICE,
             input=text
         ))
-        
-        with open(Config.TTS_FILENAME, 'wb') as f:
-            for chunk in response.iter_bytes():
-                f.write(chunk)
-        
-        return Config.TTS_FILENAME
+        buffer = io.BytesIO()
+        for chunk in response.iter_bytes():
+            buffer.write(chunk)
+        return buffer.getvalue()
     except Exception as e:
-        print(f"Error generating TTS: {e}")
+        logger.error(f"Error generating TTS: {e}", exc_info=True)
         return None
 
-async def cleanup_tts_file(voice_client, tts_file):
-    while voice_client.is_playing():
-        await asyncio.sleep(1)
-    if os.path.exists(tts_file):
-        os.remove(tts_file)
\ No newline at end of file
+async def play_audio(voice_client, audio: bytes):
+    """Play audio through FFmpeg from memory and wait until it has finished."""
+    loop = asyncio.get_running_loop()
+    finished = loop.create_future()
+
+    def after(error: Optional[Exception]):
+        # Called from the voice thread once playback ends
+        loop.call_soon_threadsafe(lambda: finished.done() or finished.set_result(error))
+
+    voice_client.play(discord.FFmpegPCMAudio(io.BytesIO(audio), pipe=True), after=after)
+    error = await finished
+    if error is not None:
+        raise error
+
+class SpeechPipeline:
+    """
+    One spoken response. Text can be fed in as it is generated; each complete
+    sentence is synthesized into its own buffer right away. At most
+    TTS_CONCURRENCY clips are synthesized or waiting ahead of playback, so a
+    long answer is not turned into audio faster than it can be played.
+    """
+    def __init__(self, voice_client):
+        self.voice_client = voice_client
+        self.buffer = ""
+        self.clips: asyncio.Queue = asyncio.Queue()
+        self.permits = asyncio.Semaphore(Config.TTS_CONCURRENCY)
+        self.start_time = time.monotonic()
+        self.done = asyncio.get_running_loop().create_future()
+
+    def feed(self, text: str):
+        self.buffer += text
+        sentences = split_sentences(self.buffer)
+        # The last piece may still be growing
+        self.buffer = sentences.pop()
+        for sentence in sentences:
+            self.speak(sentence)
+
+    def finish(self):
+        if self.buffer.strip():
+            self.speak(self.buffer)
+        self.buffer = ""
+        self.clips.put_nowait(None)
+
+    def speak(self, sentence: str):
+        if self.done.done():
+            # Playback already ended, so there is nobody left to play it
+            return
+        self.clips.put_nowait(asyncio.ensure_future(self.synthesize(sentence.strip())))
+
+    async def synthesize(self, sentence: str) -> Optional[bytes]:
+        # The permit is given back by play once the clip has been played
+        await self.permits.acquire()
+        return await synthesize(sentence)
+
+    async def play(self):
+        """Play the clips in order as they become ready, until finish has been called."""
+        spoken = failed = 0
+        result = False
+        try:
+            while True:
+                clip = await self.clips.get()
+                if clip is None:
+                    break
+                try:
+                    audio = await clip
+                    if audio is None:
+                        failed += 1
+                        continue
+                    if not spoken:
+                        first_audio = time.monotonic() - self.start_time
+                        metrics.observe("tts.first_audio_seconds", first_audio)
+                        logger.info(f"First TTS audio after {first_audio:.2f} seconds")
+                    await play_audio(self.voice_client, audio)
+                    spoken += 1
+                finally:
+                    self.permits.release()
+            logger.info(f"Played {spoken} TTS clip(s) in {time.monotonic() - self.start_time:.2f} seconds")
+            result = spoken > 0 or not failed
+        except asyncio.CancelledError:
+            # Stopped on purpose, which is not worth an error message
+            result = True
+            raise
+        except Exception as e:
+            logger.error(f"Error playing TTS: {e}", exc_info=True)
+        finally:
+            self.stop(result)
+
+    def stop(self, result: bool = True):
+        """Drop the clips not played yet."""
+        while not self.clips.empty():
+            clip = self.clips.get_nowait()
+            if clip is not None:
+                clip.cancel()
+        if not self.done.done():
+            self.done.set_result(result)
+
+    async def wait(self) -> bool:
+        """Wait until the response has been spoken or dropped. Returns False if playback failed."""
+        return await self.done
+
+class GuildPlayer:
+    """
+    Plays the responses of one guild one after another. At most TTS_MAX_QUEUE
+    responses wait behind the one being played; further ones are not spoken.
+    """
+    def __init__(self, guild_id: int):
+        self.guild_id = guild_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=Config.TTS_MAX_QUEUE)
+        self.current: Optional[SpeechPipeline] = None
+        self.worker: Optional[asyncio.Task] = None
+
+    def submit(self, voice_client) -> Optional[SpeechPipeline]:
+        speech = SpeechPipeline(voice_client)
+        if self.worker is None or self.worker.done():
+            self.current = speech
+            self.worker = asyncio.ensure_future(self.run())
+            return speech
+        try:
+            self.queue.put_nowait(speech)
+        except asyncio.QueueFull:
+            metrics.increment("tts.dropped")
+            logger.warning(f"TTS queue of guild {self.guild_id} is full, not speaking this response")
+            return None
+        return speech
+
+    async def run(self):
+        while self.current is not None:
+            await self.current.play()
+            self.current = None if self.queue.empty() else self.queue.get_nowait()
+
+    def stop(self):
+        if self.worker is not None:
+            self.worker.cancel()
+        while not self.queue.empty():
+            self.queue.get_nowait().stop()
+        if self.current is not None:
+            self.current.stop()
+            if self.current.voice_client.is_playing():
+                self.current.voice_client.stop()
+        self.current = None
+
+class VoicePlayers:
+    """The playback queue of every guild the bot speaks in."""
+    def __init__(self):
+        self.players: Dict[int, GuildPlayer] = {}
+
+    def speak(self, guild_id: int, voice_client) -> Optional[SpeechPipeline]:
+        """Queue a response for playback. Returns None when the guild's queue is full."""
+        player = self.players.get(guild_id)
+        if player is None:
+            player = self.players[guild_id] = GuildPlayer(guild_id)
+        return player.submit(voice_client)
+
+    def stop(self, guild_id: int):
+        """Stop playback and drop every queued response of the guild."""
+        player = self.players.pop(guild_id, None)
+        if player is not None:
+            player.stop()
@@ -0,0 +1,268 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+import numpy as np
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Unit vectors are stored as round(v * 127) in int8 mode
+INT8_SCALE = 127.0
+# Rows scored per step, so a search never materializes more than one block in RAM
+SEARCH_BLOCK_ROWS = 65536
+# Deleted rows are only masked out; the file is rewritten once they make up this share of it
+COMPACT_RATIO = 0.5
+# Stays below SQLite's limit on bound parameters per statement
+SQL_BATCH_SIZE = 500
+
+class MmapVectorStore(VectorStore):
+    """
+    Vector store backed by a quantized (float16 or int8) NumPy matrix in a
+    memory-mapped file, with chunk text and metadata in a SQLite side table.
+    Opening the store only maps the file; vectors are paged in by the OS as
+    searches touch them, so resident memory stays flat as the corpus grows.
+    It also implements the add/delete/ids interface of the RAG indexes.
+    """
+    def __init__(self, directory: str, embedding: Embeddings, dtype: str = "float16"):
+        if dtype not in ("float16", "int8"):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        os.makedirs(directory, exist_ok=True)
+        self.embedding = embedding
+        self.dtype = np.dtype(dtype)
+        self.vectors_path = os.path.join(directory, f"vectors.{dtype}.bin")
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(directory, f"chunks.{dtype}.sqlite3"), check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                row INTEGER PRIMARY KEY,
+                id TEXT UNIQUE NOT NULL,
+                source TEXT,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                deleted INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        """)
+        dim = self.db.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+        self.dim = int(dim[0]) if dim else None
+        self.rows = self.db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        self.deleted = np.zeros(self.rows, dtype=bool)
+        deleted_rows = [row for (row,) in self.db.execute("SELECT row FROM chunks WHERE deleted = 1")]
+        self.deleted[deleted_rows] = True
+        # Bumped whenever rows are renumbered, so searches never mix up old and new row numbers
+        self.generation = 0
+        self.matrix = None
+        self._map()
+        logger.info(f"Opened memory-mapped vector store with {self.count()} vectors ({dtype})")
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def _map(self):
+        if self.rows and self.dim:
+            self.matrix = np.memmap(self.vectors_path, dtype=self.dtype, mode='r', shape=(self.rows, self.dim))
+        else:
+            self.matrix = None
+
+    def _quantize(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = normalize(vectors)
+        if self.dtype == np.int8:
+            return np.clip(np.rint(vectors * INT8_SCALE), -127, 127).astype(np.int8)
+        return vectors.astype(np.float16)
+
+    # Index interface used by RAGSystem
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]):
+        self.add_texts(texts, metadatas=metadatas, ids=ids)
+
+    def ids(self, source: Optional[str] = None) -> Set[str]:
+        with self.lock:
+            if source is None:
+                cursor = self.db.execute("SELECT id FROM chunks WHERE deleted = 0")
+            else:
+                cursor = self.db.execute("SELECT id FROM chunks WHERE deleted = 0 AND source = ?", (source,))
+            return {cid for (cid,) in cursor}
+
+    def sources(self) -> Set[str]:
+        with self.lock:
+            return {source for (source,) in self.db.execute("SELECT DISTINCT source FROM chunks WHERE deleted = 0")}
+
+    def metadatas(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        with self.lock:
+            rows = self.db.execute("SELECT id, metadata FROM chunks WHERE deleted = 0").fetchall()
+        return ((cid, json.loads(metadata)) for cid, metadata in rows)
+
+    def count(self) -> int:
+        return int(self.rows - self.deleted.sum())
+
+    def save(self):
+        # Every write is committed as it happens
+        pass
+
+    # LangChain VectorStore interface
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        if ids is None:
+            raise ValueError("MmapVectorStore requires explicit chunk IDs")
+        existing = set()
+        with self.lock:
+            for batch in batched(ids):
+                existing.update(cid for (cid,) in self.db.execute(
+                    f"SELECT id FROM chunks WHERE deleted = 0 AND id IN ({','.join('?' * len(batch))})", batch))
+        new = [i for i, cid in enumerate(ids) if cid not in existing]
+        if not new:
+            return list(ids)
+
+        vectors = np.asarray(self.embedding.embed_documents([texts[i] for i in new]), dtype=np.float32)
+        with self.lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dim', ?)", (str(self.dim),))
+            # Anything past the committed rows is a leftover of an interrupted write
+            with open(self.vectors_path, 'ab') as file:
+                file.truncate(self.rows * self.dim * self.dtype.itemsize)
+                file.write(self._quantize(vectors).tobytes())
+            # A re-added chunk gets a new row; its deleted row keeps its place until the next compaction
+            for batch in batched([ids[i] for i in new]):
+                self.db.execute(f"UPDATE chunks SET id = 'deleted:' || row "
+                                f"WHERE deleted = 1 AND id IN ({','.join('?' * len(batch))})", batch)
+            self.db.executemany(
+                "INSERT INTO chunks (row, id, source, text, metadata) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (self.rows + offset, ids[i], metadatas[i].get("source"), texts[i], json.dumps(metadatas[i]))
+                    for offset, i in enumerate(new)
+                ]
+            )
+            self.db.commit()
+            self.rows += len(new)
+            self.deleted = np.concatenate([self.deleted, np.zeros(len(new), dtype=bool)])
+            self._map()
+        return list(ids)
+
+    def delete(self, ids: Optional[Iterable[str]] = None, **kwargs: Any) -> Optional[bool]:
+        ids = list(ids or [])
+        if not ids:
+            return True
+        with self.lock:
+            rows = []
+            for batch in batched(ids):
+                placeholders = ','.join('?' * len(batch))
+                rows.extend(row for (row,) in self.db.execute(
+                    f"SELECT row FROM chunks WHERE deleted = 0 AND id IN ({placeholders})", batch))
+                self.db.execute(f"UPDATE chunks SET deleted = 1 WHERE id IN ({placeholders})", batch)
+            self.db.commit()
+            self.deleted[rows] = True
+            if self.rows and self.deleted.sum() / self.rows >= COMPACT_RATIO:
+                self._compact()
+        return True
+
+    def _compact(self):
+        """Rewrite the matrix without deleted rows. Must be called with the lock held."""
+        live = np.flatnonzero(~self.deleted)
+        temp_path = self.vectors_path + ".tmp"
+        with open(temp_path, 'wb') as file:
+            for start in range(0, len(live), SEARCH_BLOCK_ROWS):
+                file.write(np.ascontiguousarray(self.matrix[live[start:start + SEARCH_BLOCK_ROWS]]).tobytes())
+        self.db.execute("DELETE FROM chunks WHERE deleted = 1")
+        # Ascending renumbering never collides: every live row moves to a lower or equal number
+        self.db.executemany("UPDATE chunks SET row = ? WHERE row = ?",
+                            [(new_row, int(old_row)) for new_row, old_row in enumerate(live)])
+        self.db.commit()
+        os.replace(temp_path, self.vectors_path)
+        self.rows = len(live)
+        self.deleted = np.zeros(self.rows, dtype=bool)
+        self.generation += 1
+        self._map()
+        logger.info(f"Compacted memory-mapped vector store to {self.rows} vectors")
+
+    def search_batch(self, queries: np.ndarray, k: int) -> List[List[Tuple[int, float]]]:
+        """Vectorized top-k cosine search for a batch of query vectors, scanning the matrix block by block."""
+        queries = normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        with self.lock:
+            matrix, deleted = self.matrix, self.deleted
+        if matrix is None or k <= 0:
+            return [[] for _ in queries]
+        scale = 1.0 / INT8_SCALE if self.dtype == np.int8 else 1.0
+
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(matrix), SEARCH_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            scores = queries @ block.T * scale
+            scores[:, deleted[start:start + len(block)]] = -np.inf
+            rows = np.broadcast_to(np.arange(start, start + len(block)), scores.shape)
+            scores = np.concatenate([best_scores, scores], axis=1)
+            rows = np.concatenate([best_rows, rows], axis=1)
+            if scores.shape[1] > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, top, axis=1)
+                rows = np.take_along_axis(rows, top, axis=1)
+            best_scores, best_rows = scores, rows
+
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        return [
+            [(int(row), float(score)) for row, score in zip(rows, scores) if np.isfinite(score)]
+            for rows, scores in zip(best_rows, best_scores)
+        ]
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4) -> List[Tuple[Document, float]]:
+        while True:
+            generation = self.generation
+            hits = self.search_batch(np.asarray([embedding]), k)[0]
+            with self.lock:
+                if generation != self.generation:
+                    # Rows were renumbered by a compaction while searching
+                    continue
+                if not hits:
+                    return []
+                rows = [row for row, _ in hits]
+                found = {row: (text, metadata) for row, text, metadata in self.db.execute(
+                    f"SELECT row, text, metadata FROM chunks WHERE row IN ({','.join('?' * len(rows))})", rows)}
+            return [
+                (Document(page_content=found[row][0], metadata=json.loads(found[row][1])), score)
+                for row, score in hits if row in found
+            ]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        # Scores are already cosine similarities
+        return lambda score: score
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, directory: str = "./vector_index", dtype: str = "float16",
+                   **kwargs: Any) -> "MmapVectorStore":
+        store = cls(directory, embedding, dtype=dtype)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+def batched(items: List[str]) -> Iterable[List[str]]:
+    for start in range(0, len(items), SQL_BATCH_SIZE):
+        yield items[start:start + SQL_BATCH_SIZE]
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms